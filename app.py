@@ -1,20 +1,118 @@
 
 import os
+import atexit
+import copy
+import hashlib
+import json
+import queue
+import secrets
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict, namedtuple
+from contextlib import contextmanager
 import streamlit as st
 import pandas as pd
-from sentence_transformers import SentenceTransformer, util
-from transformers import pipeline, AutoTokenizer, AutoModelForCausalLM
 import numpy as np
-import torch
+
+# torch, transformers and sentence_transformers take seconds to import, so they
+# are imported inside the generation and matching functions that need them;
+# the landing page and sidebar render without loading the ML stack.
 
 # --- Configuration ---
 st.set_page_config(page_title="Tasker.ai", layout="wide")
 LOGO_PATH = os.path.join("assets", "tasker_logo.png")
+EMBEDDING_MODEL_NAME = "all-MiniLM-L6-v2"
+EMBEDDING_BATCH_SIZE = int(os.getenv("TASKER_EMBED_BATCH_SIZE", "64"))
+MAX_NEW_TOKENS = 160
+# Generation stops early once the output loops on the same token n-gram, or after this many seconds
+GENERATION_REPEAT_NGRAM = 6
+GENERATION_DEADLINE_S = float(os.getenv("TASKER_GENERATION_DEADLINE_S", "20"))
+# PRD sections keep this many sentences, so decoding stops once they exist
+PRD_SECTION_ITEMS = (3, 6, 8)
+TASK_LIST_ITEMS = 12
+# Task lists are decoded under a JSON grammar: [{"title", "phase", "skills"}, ...] with these caps
+TASK_PHASES = ("planning", "setup", "development", "testing", "release")
+TASK_JSON_MAX_NEW_TOKENS = 384
+TASK_JSON_TITLE_TOKENS = 16
+TASK_JSON_SKILL_TOKENS = 4
+TASK_JSON_MAX_SKILLS = 3
+# "eager" (fp32), "int8" (dynamic int8 linear layers) or "compiled" (torch.compile'd forward)
+INFERENCE_BACKENDS = ("eager", "int8", "compiled")
+INFERENCE_BACKEND = os.getenv("TASKER_INFERENCE_BACKEND", "eager")
+# Intra-op threads for CPU inference; 0 keeps the torch default
+TORCH_THREADS = int(os.getenv("TASKER_TORCH_THREADS", "0"))
+# "host:port" of a running inference_worker.py; when set, generation is sent there instead of run in-process
+INFERENCE_WORKER_ADDRESS = os.getenv("TASKER_INFERENCE_WORKER", "")
+# Shared secret for the worker connection; unset means a random key file under CACHE_DIR (see inference_worker_authkey)
+INFERENCE_WORKER_KEY = os.getenv("TASKER_INFERENCE_WORKER_KEY", "")
+# Load both models on a background thread as soon as the server process serves its first page
+MODEL_WARMUP = os.getenv("TASKER_MODEL_WARMUP", "1") == "1"
+PREFIX_CACHE_MAX_MB = int(os.getenv("TASKER_PREFIX_CACHE_MB", "256"))
+# "sample" draws fresh text every time; "seeded" and "greedy" are deterministic and served from the generation cache;
+# "best_of_n" samples GENERATION_BEST_OF continuations per prompt in the same batch and keeps the best-ranked one
+GENERATION_MODES = ("sample", "seeded", "greedy", "best_of_n")
+GENERATION_MODE = os.getenv("TASKER_GENERATION_MODE", "sample")
+GENERATION_SEED = int(os.getenv("TASKER_GENERATION_SEED", "0"))
+GENERATION_BEST_OF = int(os.getenv("TASKER_GENERATION_BEST_OF", "4"))
+# Weight of the repeated word-trigram fraction against embedding similarity when ranking best-of-n samples
+BEST_OF_REPETITION_PENALTY = 1.0
+GENERATION_CACHE_MAX_ENTRIES = int(os.getenv("TASKER_GENERATION_CACHE_ENTRIES", "2000"))
+CACHE_DIR = os.getenv("TASKER_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "tasker"))
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.getenv("TASKER_EMBED_CACHE_ENTRIES", "50000"))
+# The embedding store's index is written to disk at most this often, plus at exit and whenever slots are reused
+EMBEDDING_STORE_FLUSH_S = 5.0
+# Rosters at least this large are matched through the approximate (IVF) index
+ANN_MIN_ROSTER = int(os.getenv("TASKER_ANN_MIN_ROSTER", "20000"))
+ANN_NPROBE = int(os.getenv("TASKER_ANN_NPROBE", "16"))
+ANN_REBUILD_FRACTION = 0.5
+ANN_MAX_SAVED_INDEXES = 4
+# Capacity-constrained assignment: exact solves predicted to exceed the budget fall back to greedy
+SOLVER_TIME_BUDGET_S = float(os.getenv("TASKER_SOLVER_BUDGET_S", "10"))
+SOLVER_OPS_PER_SECOND = 5e10
+# The exact solve copies n_tasks x n_slots scores to float64; this keeps that matrix near 500 MB
+SOLVER_MAX_CELLS = 60_000_000
+# Top-k selection works through score matrices this many rows at a time
+TOP_K_BLOCK_ROWS = 256
+# Alternates kept per task for the top-k suggestions view
+TOP_K_MAX = 10
+# Employee CSV columns kept on upload and their pinned dtypes; anything else is skipped
+EMPLOYEE_COLUMNS = {
+    "candidate_id": "Int64",
+    "name": "object",
+    "job_title": "category",
+    "skills": "object",
+    "summary": "object",
+    "resume_text": "object",
+    "experience_years": "Int64",
+    "location": "category",
+    "capacity": "Int64",
+}
+REQUIRED_EMPLOYEE_COLUMNS = ("name", "skills")
+EMPLOYEE_CSV_CHUNK_ROWS = 50_000
+# Candidate fields embedded for matching and their default fusion weights
+CANDIDATE_FIELD_WEIGHTS = {"skills": 0.6, "job_title": 0.2, "summary": 0.2, "resume_text": 0.2}
+# Long fields split into overlapping token windows and scored by their best-matching window
+CHUNKED_FIELDS = ("resume_text",)
+RESUME_CHUNK_TOKENS = 128
+RESUME_CHUNK_OVERLAP = 32
+RESUME_BATCH_SIZE = 256
+# ANN candidates fetched per returned row when chunked fields need re-scoring
+ANN_RERANK_FACTOR = 4
+
+# Generated tasks/features at least this similar are collapsed into one; longer lists are LSH-blocked first
+DEDUP_SIMILARITY = float(os.getenv("TASKER_DEDUP_SIMILARITY", "0.85"))
+DEDUP_LSH_MIN_ITEMS = 2000
+DEDUP_LSH_TABLES = 8
+DEDUP_LSH_BITS = 10
 
 # Initialize model cache in session state
 if "text_generator" not in st.session_state:
     st.session_state["text_generator"] = None
     st.session_state["model_loaded"] = False
+if "generation_mode" not in st.session_state:
+    st.session_state["generation_mode"] = GENERATION_MODE if GENERATION_MODE in GENERATION_MODES else "sample"
 
 
 def get_palette(theme):
@@ -698,6 +796,11 @@ def render_header(prefer_logo=True):
 
 # --- Main App ---
 def main():
+    # Streamlit only runs this script once a session connects, so the first page render is
+    # the earliest point the warm-up can start; it is not started at import so scripts that
+    # import app (the inference worker, benchmarks) do not load models they never use
+    if MODEL_WARMUP:
+        get_model_warmup()
     if "show_landing" not in st.session_state:
         st.session_state["show_landing"] = True
     if "theme" not in st.session_state:
@@ -786,11 +889,22 @@ def main():
     st.sidebar.subheader("Data Management")
     uploaded_file = st.sidebar.file_uploader("Upload Employee CSV", type=["csv"])
     if uploaded_file:
-        try:
-            employees_df = pd.read_csv(uploaded_file)
-            st.session_state["employees_df"] = employees_df
-        except Exception as e:
-            st.sidebar.error(f"Error reading CSV: {e}")
+        # Reruns with the same upload reuse the parsed frame already in session
+        file_id = getattr(uploaded_file, "file_id", None) or uploaded_file.name
+        if st.session_state.get("employees_file_id") != file_id:
+            try:
+                employees_df, dropped = parse_employee_csv(employee_csv_hash(uploaded_file), uploaded_file)
+                st.session_state["employees_df"] = employees_df
+                st.session_state["employees_file_id"] = file_id
+                st.session_state["employees_dropped_rows"] = dropped
+            except Exception as e:
+                st.sidebar.error(f"Error reading CSV: {e}")
+        if st.session_state.get("employees_dropped_rows"):
+            st.sidebar.warning(
+                f"Skipped {st.session_state['employees_dropped_rows']} rows without a name or skills."
+            )
+    render_model_cache_panel()
+    render_warmup_status()
 
     # --- Main Content ---
     tab1, tab2, tab3, tab4 = st.tabs(
@@ -906,6 +1020,24 @@ def main():
         if "tasks" in st.session_state:
             st.markdown("---")
             st.subheader("📝 Generated Tasks")
+            col_new_task, col_add = st.columns([4, 1])
+            with col_new_task:
+                new_task = st.text_input(
+                    "Add a task",
+                    placeholder="Describe an extra task to include...",
+                    label_visibility="collapsed",
+                )
+            with col_add:
+                if st.button("➕ Add Task", use_container_width=True) and new_task.strip():
+                    st.session_state["tasks"] = list(st.session_state["tasks"]) + [new_task.strip()]
+                    # Existing assignments are refreshed incrementally: only the new task is encoded
+                    if "assignments_df" in st.session_state and "employees_df" in st.session_state:
+                        assign_tasks(
+                            st.session_state["tasks"],
+                            st.session_state["employees_df"],
+                            st.session_state.get("assignment_cap"),
+                            st.session_state.get("assignment_weights"),
+                        )
             tasks = st.session_state["tasks"]
             if isinstance(tasks, list):
                 for i, task in enumerate(tasks, 1):
@@ -939,12 +1071,63 @@ def main():
             st.subheader("📊 Available Employees")
             st.dataframe(st.session_state["employees_df"], use_container_width=True, hide_index=True)
 
+            employees_df = st.session_state["employees_df"]
+            weighted_fields = [field for field in CANDIDATE_FIELD_WEIGHTS if field in employees_df.columns]
+            field_weights = dict(CANDIDATE_FIELD_WEIGHTS)
+            if len(weighted_fields) > 1:
+                with st.expander("⚖️ Matching weights"):
+                    st.caption("How much each profile field counts when matching tasks to people.")
+                    weight_cols = st.columns(len(weighted_fields))
+                    for col, field in zip(weight_cols, weighted_fields):
+                        with col:
+                            field_weights[field] = st.slider(
+                                field.replace("_", " ").title(),
+                                min_value=0.0,
+                                max_value=1.0,
+                                value=float(CANDIDATE_FIELD_WEIGHTS[field]),
+                                step=0.05,
+                                key=f"weight_{field}",
+                            )
+            # New weights only recombine cached field embeddings, so refresh right away
+            previous_weights = st.session_state.get("assignment_weights")
+            if (
+                "assignments_df" in st.session_state
+                and "tasks" in st.session_state
+                and previous_weights is not None
+                and previous_weights != field_weights
+            ):
+                assign_tasks(
+                    st.session_state["tasks"],
+                    employees_df,
+                    st.session_state.get("assignment_cap"),
+                    field_weights,
+                )
+
             if "tasks" in st.session_state:
+                col_mode, col_cap = st.columns([2, 1])
+                with col_mode:
+                    assignment_mode = st.radio(
+                        "Assignment mode",
+                        ["Best match per task", "Balance workload (capacity)"],
+                        horizontal=True,
+                        help="Balanced mode finds the best overall assignment without exceeding anyone's capacity.",
+                    )
+                uniform_cap = None
+                if assignment_mode == "Balance workload (capacity)":
+                    with col_cap:
+                        uniform_cap = int(
+                            st.number_input(
+                                "Max tasks per employee",
+                                min_value=1,
+                                value=3,
+                                help="Used for employees without a `capacity` value in the CSV.",
+                            )
+                        )
                 col_btn1, col_btn2 = st.columns([1, 4])
                 with col_btn1:
                     if st.button("🎯 Assign Tasks", type="primary", use_container_width=True):
                         assign_tasks(
-                            st.session_state["tasks"], st.session_state["employees_df"]
+                            st.session_state["tasks"], employees_df, uniform_cap, field_weights
                         )
             else:
                 st.info("ℹ️ Generate tasks first in the 'Task Generation' tab to assign them.")
@@ -963,6 +1146,23 @@ def main():
                     "text/csv",
                     type="primary",
                 )
+
+            if "similarity" in st.session_state:
+                similarity = st.session_state["similarity"]
+                n_employees = len(similarity["employees_df"])
+                st.markdown("---")
+                st.subheader("🔁 Alternate Candidates")
+                if n_employees > 1:
+                    k = st.slider(
+                        "Suggestions per task",
+                        min_value=1,
+                        max_value=min(TOP_K_MAX, n_employees),
+                        value=min(3, n_employees),
+                        help="Best-scoring employees for each task, to help reassign without rerunning.",
+                    )
+                else:
+                    k = 1
+                st.dataframe(build_suggestions_df(similarity, k), use_container_width=True, hide_index=True)
         else:
             st.warning("⚠️ Please upload an employee CSV file in the sidebar.")
             st.info("💡 The CSV should have columns: `name` and `skills`")
@@ -1031,7 +1231,7 @@ def main():
                         from_email,
                         to_email,
                         signature,
-                        st.session_state.get("project_name", "Project"),
+                        st.session_state.get("project_name", ""),
                         st.session_state.get("prd", ""),
                         st.session_state.get("tasks", []),
                     )
@@ -1055,105 +1255,1884 @@ def main():
             with st.expander("📄 Assignment summary used for the email"):
                 st.dataframe(assignments_df, use_container_width=True, hide_index=True)
 
+def conv1d_to_linear(module):
+    """Swap GPT-2 ``Conv1D`` projections for equivalent ``nn.Linear`` layers in place.
+
+    ``Conv1D`` stores its weight as (in, out), so dynamic quantization, which
+    only rewrites ``nn.Linear``, would otherwise leave every projection fp32.
+    """
+    import torch
+    from transformers.pytorch_utils import Conv1D
+
+    for parent in list(module.modules()):
+        for name, child in list(parent.named_children()):
+            if isinstance(child, Conv1D):
+                n_in, n_out = child.weight.shape
+                linear = torch.nn.Linear(n_in, n_out)
+                linear.weight.data = child.weight.data.t().contiguous()
+                linear.bias.data = child.bias.data
+                setattr(parent, name, linear)
+    return module
+
+
+def apply_inference_backend(model, backend):
+    """Return ``model`` prepared for the configured CPU inference backend."""
+    import torch
+
+    if backend == "int8":
+        # The tied lm_head stays fp32; quantizing it costs accuracy for a separate int8 copy of the embedding
+        conv1d_to_linear(model.transformer)
+        model.transformer = torch.ao.quantization.quantize_dynamic(
+            model.transformer, {torch.nn.Linear}, dtype=torch.qint8
+        )
+    elif backend == "compiled":
+        eager_forward = model.forward
+        model.forward = torch.compile(eager_forward, dynamic=True)
+        try:
+            # Compile now rather than inside the first user request
+            with torch.inference_mode():
+                model(input_ids=torch.zeros((1, 8), dtype=torch.long, device=model.device))
+        except Exception:
+            # No working compiler toolchain: keep serving with the eager forward
+            model.forward = eager_forward
+    model.inference_backend = backend
+    return model
+
+
+def model_cache_id(model):
+    """Identifies a loaded model in cache keys; backends produce different activations."""
+    return f"{model.name_or_path}@{getattr(model, 'inference_backend', 'eager')}"
+
+
+# What generation needs from a loaded model; prompts go through ``model.generate`` as token ids
+TextGenerator = namedtuple("TextGenerator", ["model", "tokenizer"])
+
+
 @st.cache_resource
-def load_text_generator():
-    """Load the text generation model (cached to avoid reloading)"""
+def load_text_generator(backend=INFERENCE_BACKEND):
+    """Load the text generation model and tokenizer (cached to avoid reloading)"""
     try:
+        import torch
+        from transformers import AutoTokenizer, AutoModelForCausalLM
+
+        if backend not in INFERENCE_BACKENDS:
+            raise ValueError(f"unknown inference backend {backend!r}, expected one of {INFERENCE_BACKENDS}")
+        if TORCH_THREADS:
+            torch.set_num_threads(TORCH_THREADS)
+
         # Using distilgpt2 - smaller and faster than gpt2, good for basic text generation
         model_name = "distilgpt2"
         tokenizer = AutoTokenizer.from_pretrained(model_name)
         model = AutoModelForCausalLM.from_pretrained(model_name)
+        model.eval()
+        # Use CPU if no GPU; int8 dynamic quantization only runs on CPU
+        if torch.cuda.is_available() and backend != "int8":
+            model.to("cuda")
+        model = apply_inference_backend(model, backend)
         
         # Set pad token if not present
         if tokenizer.pad_token is None:
             tokenizer.pad_token = tokenizer.eos_token
         
-        generator = pipeline(
-            "text-generation",
-            model=model,
-            tokenizer=tokenizer,
-            device=-1 if not torch.cuda.is_available() else 0,  # Use CPU if no GPU
-        )
-        return generator
+        return TextGenerator(model, tokenizer)
     except Exception as e:
         st.error(f"Error loading model: {e}")
         return None
 
-def generate_from_model(prompt):
-    """Generate text using local model"""
-    try:
-        # Load model if not already loaded
-        if st.session_state["text_generator"] is None:
-            with st.spinner("Loading AI model (first time only, this may take a moment)..."):
-                generator = load_text_generator()
-                if generator is None:
-                    return None
-                st.session_state["text_generator"] = generator
-                st.session_state["model_loaded"] = True
-        
-        generator = st.session_state["text_generator"]
-
-        tokenizer = generator.tokenizer
-        # GPT-2 family supports ~1024 tokens context; keep prompt well under that.
-        max_ctx = (
-            getattr(generator.model.config, "n_positions", None)
-            or getattr(generator.model.config, "max_position_embeddings", 1024)
-            or 1024
+class EmbeddingModelRegistry:
+    """Process-wide SentenceTransformer instances shared by every session."""
+
+    def __init__(self):
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name=EMBEDDING_MODEL_NAME):
+        """Return the named model, loading it on first use."""
+        model = self._models.get(model_name)
+        if model is not None:
+            return model
+        with self._lock:
+            # Another session may have finished loading while we waited
+            model = self._models.get(model_name)
+            if model is None:
+                from sentence_transformers import SentenceTransformer
+
+                model = SentenceTransformer(model_name)
+                self._models[model_name] = model
+        return model
+
+    def warm(self, model_name=EMBEDDING_MODEL_NAME):
+        """Load the model ahead of the first request that needs it."""
+        self.get(model_name)
+
+    def evict(self, model_name=EMBEDDING_MODEL_NAME):
+        """Drop the model so its weights can be reclaimed. Returns True if it was loaded."""
+        with self._lock:
+            model = self._models.pop(model_name, None)
+        if model is None:
+            return False
+        del model
+        import torch
+
+        if torch.cuda.is_available():
+            torch.cuda.empty_cache()
+        return True
+
+    def is_loaded(self, model_name=EMBEDDING_MODEL_NAME):
+        return model_name in self._models
+
+    def memory_usage(self):
+        """Bytes held by the parameters and buffers of each loaded model."""
+        usage = {}
+        for name, model in list(self._models.items()):
+            tensors = list(model.parameters()) + list(model.buffers())
+            usage[name] = sum(t.numel() * t.element_size() for t in tensors)
+        return usage
+
+
+@st.cache_resource
+def get_embedding_registry():
+    """Single registry per server process (cached to avoid one model copy per session)"""
+    return EmbeddingModelRegistry()
+
+
+def get_embedding_model(model_name=EMBEDDING_MODEL_NAME):
+    """Return the shared embedding model, loading it on first use."""
+    registry = get_embedding_registry()
+    if not registry.is_loaded(model_name):
+        with st.spinner("Loading embedding model (first time only, this may take a moment)..."):
+            return registry.get(model_name)
+    return registry.get(model_name)
+
+
+class EmbeddingStore:
+    """On-disk, content-addressed float16 embedding cache with LRU eviction.
+
+    Vectors live in a fixed number of slots in a memory-mapped float16 file. A
+    compact index maps hash(model name + normalized text) to a slot and records
+    a last-use tick per slot, so the least recently used rows are overwritten
+    first once the store is full. The index is flushed at most every
+    EMBEDDING_STORE_FLUSH_S seconds while only free slots are being filled
+    (a lost update just forgets those rows), and right away when a slot is
+    reused, so the file never maps an old key to a new vector.
+    """
+
+    def __init__(self, directory, max_entries=EMBEDDING_CACHE_MAX_ENTRIES):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._vectors_path = os.path.join(directory, "vectors.f16")
+        self._index_path = os.path.join(directory, "index.npz")
+        self._vectors = None
+        self._dim = None
+        self._keys = np.zeros(max_entries, dtype="S16")
+        self._ticks = np.zeros(max_entries, dtype=np.int64)
+        self._slots = {}
+        self._dirty = False
+        self._last_flush = time.monotonic()
+        self._load()
+        atexit.register(self.flush)
+
+    @staticmethod
+    def key(model_name, text):
+        """Content address for a text under a given model."""
+        normalized = " ".join(unicodedata.normalize("NFC", str(text)).split())
+        payload = f"{model_name}\0{normalized}".encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).digest()
+
+    def _load(self):
+        if not (os.path.exists(self._index_path) and os.path.exists(self._vectors_path)):
+            return
+        try:
+            with np.load(self._index_path) as index:
+                keys, ticks, dim = index["keys"], index["ticks"], int(index["dim"])
+            if len(keys) != self.max_entries:
+                return
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float16, mode="r+", shape=(self.max_entries, dim)
+            )
+        except (OSError, ValueError, KeyError):
+            # Unreadable or resized store: start over rather than fail the request
+            return
+        self._dim = dim
+        self._keys = keys.astype("S16")
+        self._ticks = ticks.astype(np.int64)
+        occupied = np.flatnonzero(self._ticks)
+        self._slots = {bytes(self._keys[slot]): int(slot) for slot in occupied}
+
+    def _ensure_vectors(self, dim):
+        if self._vectors is None:
+            self._dim = dim
+            self._vectors = np.memmap(
+                self._vectors_path, dtype=np.float16, mode="w+", shape=(self.max_entries, dim)
+            )
+
+    def _flush(self):
+        tmp_path = self._index_path + ".tmp.npz"
+        np.savez(tmp_path, keys=self._keys, ticks=self._ticks, dim=np.int64(self._dim))
+        self._vectors.flush()
+        os.replace(tmp_path, self._index_path)
+        self._dirty = False
+        self._last_flush = time.monotonic()
+
+    def flush(self):
+        """Write pending index changes to disk."""
+        with self._lock:
+            if self._dirty:
+                self._flush()
+
+    def get_many(self, keys):
+        """Return (float32 array with zero rows for misses, positions of the misses)."""
+        with self._lock:
+            dim = self._dim or 0
+            out = np.zeros((len(keys), dim), dtype=np.float32)
+            missing = []
+            tick = int(self._ticks.max()) + 1
+            for pos, key in enumerate(keys):
+                slot = self._slots.get(key)
+                if slot is None:
+                    missing.append(pos)
+                    continue
+                out[pos] = self._vectors[slot]
+                self._ticks[slot] = tick
+            self.hits += len(keys) - len(missing)
+            self.misses += len(missing)
+            return out, missing
+
+    def put_many(self, keys, vectors):
+        """Store vectors, evicting the least recently used slots when full."""
+        vectors = np.asarray(vectors, dtype=np.float16)
+        if not len(keys):
+            return
+        with self._lock:
+            self._ensure_vectors(vectors.shape[1])
+            # Keep only the most recent rows if the batch alone overflows the store
+            keys, vectors = list(keys)[-self.max_entries:], vectors[-self.max_entries:]
+            # Membership is decided under the lock, so keys another session stored meanwhile are reused
+            tick = int(self._ticks.max()) + 1
+            present = [self._slots[key] for key in keys if key in self._slots]
+            # Touch this batch's existing slots first so eviction cannot pick them
+            self._ticks[present] = tick
+            new_keys = [key for key in dict.fromkeys(keys) if key not in self._slots]
+            free = np.flatnonzero(self._ticks == 0)
+            shortfall = len(new_keys) - len(free)
+            if shortfall > 0:
+                occupied = np.flatnonzero((self._ticks > 0) & (self._ticks < tick))
+                victims = occupied[np.argpartition(self._ticks[occupied], shortfall - 1)[:shortfall]]
+                for slot in victims:
+                    del self._slots[bytes(self._keys[slot])]
+                self._ticks[victims] = 0
+                free = np.flatnonzero(self._ticks == 0)
+            for key, slot in zip(new_keys, free):
+                self._slots[key] = int(slot)
+                self._keys[slot] = key
+            slots = np.fromiter((self._slots[key] for key in keys), dtype=np.intp, count=len(keys))
+            self._vectors[slots] = vectors
+            self._ticks[slots] = tick
+            self._dirty = True
+            if shortfall > 0 or time.monotonic() - self._last_flush >= EMBEDDING_STORE_FLUSH_S:
+                self._flush()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._slots),
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+@st.cache_resource
+def get_embedding_store(model_name=EMBEDDING_MODEL_NAME):
+    """Persistent embedding store for one model, shared across sessions"""
+    slug = "".join(ch if ch.isalnum() or ch in "-_." else "_" for ch in model_name)
+    return EmbeddingStore(os.path.join(CACHE_DIR, "embeddings", slug))
+
+
+def render_model_cache_panel():
+    """Sidebar controls for the shared embedding model cache."""
+    registry = get_embedding_registry()
+    with st.sidebar.expander("⚙️ Model cache"):
+        usage = registry.memory_usage()
+        if usage:
+            for name, size in usage.items():
+                st.caption(f"{name}: {size / 1024 ** 2:.1f} MB")
+        else:
+            st.caption("No embedding model loaded yet.")
+        store_stats = get_embedding_store().stats()
+        st.caption(
+            f"Embedding store: {store_stats['entries']:,}/{store_stats['max_entries']:,} rows, "
+            f"hit rate {store_stats['hit_rate']:.0%} "
+            f"({store_stats['hits']:,} hits / {store_stats['misses']:,} misses)"
         )
-        max_new_tokens = 160
-        max_prompt_tokens = max(64, max_ctx - max_new_tokens - 8)
-
-        # Format prompt for better generation
-        formatted_prompt = (prompt or "").strip()
-
-        # Token-safe truncation from the end of the prompt
-        encoded = tokenizer.encode(formatted_prompt, add_special_tokens=False)
-        if len(encoded) > max_prompt_tokens:
-            encoded = encoded[-max_prompt_tokens:]
-            formatted_prompt = tokenizer.decode(encoded, skip_special_tokens=True)
-        formatted_prompt = formatted_prompt + "\n\n"
-
-        # Generate text
-        results = generator(
-            formatted_prompt,
-            max_new_tokens=max_new_tokens,
-            num_return_sequences=1,
-            temperature=0.7,
-            do_sample=True,
-            pad_token_id=tokenizer.eos_token_id,
-            truncation=True,
-            return_full_text=True,
+        prefix_stats = get_prefix_cache().stats()
+        st.caption(
+            f"Prompt prefix cache: {prefix_stats['entries']} prefixes, "
+            f"{prefix_stats['bytes'] / 1024 ** 2:.1f}/{prefix_stats['max_bytes'] / 1024 ** 2:.0f} MB, "
+            f"hit rate {prefix_stats['hit_rate']:.0%}"
         )
+        if INFERENCE_WORKER_ADDRESS:
+            try:
+                worker_stats = worker_request({"op": "stats"})
+                st.caption(
+                    f"Inference worker: {worker_stats['queue_depth']}/{worker_stats['max_queue']} queued, "
+                    f"p50 {worker_stats['p50_ms']:.0f} ms, p99 {worker_stats['p99_ms']:.0f} ms"
+                )
+            except Exception as e:
+                st.caption(f"Inference worker unavailable: {e}")
+        generation_stats = get_generation_cache().stats()
+        st.caption(
+            f"Generation cache: {generation_stats['entries']:,}/{generation_stats['max_entries']:,} completions, "
+            f"hit rate {generation_stats['hit_rate']:.0%}"
+        )
+        st.selectbox(
+            "Text generation",
+            GENERATION_MODES,
+            key="generation_mode",
+            help=(
+                "Seeded and greedy output is repeatable, so repeat drafts are served from the cache. "
+                "Best-of-n samples several drafts at once and keeps the one closest to the project."
+            ),
+        )
+        col_warm, col_evict = st.columns(2)
+        with col_warm:
+            if st.button("Warm", key="warm_embedding_model", use_container_width=True):
+                get_embedding_model()
+                st.rerun()
+        with col_evict:
+            if st.button("Release", key="evict_embedding_model", use_container_width=True):
+                registry.evict(EMBEDDING_MODEL_NAME)
+                st.rerun()
 
-        generated_text = results[0].get("generated_text", "")
-        
-        # Remove the original prompt from the generated text
-        if generated_text.startswith(formatted_prompt):
-            generated_text = generated_text[len(formatted_prompt):].strip()
-        
-        return generated_text
+
+class PrefixKVCache:
+    """LRU of past_key_values for shared prompt prefixes, bounded by memory.
+
+    Entries are keyed by model and prefix token ids; callers receive a copy
+    since ``generate`` extends the cache in place.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def entry_bytes(model, n_tokens):
+        """Keys and values for ``n_tokens`` positions across every layer."""
+        config = model.config
+        n_layer = getattr(config, "n_layer", None) or config.num_hidden_layers
+        hidden = getattr(config, "n_embd", None) or config.hidden_size
+        return 2 * n_layer * hidden * n_tokens * model.dtype.itemsize
+
+    def get(self, model, prefix_ids):
+        """Return a private copy of the prefix's past_key_values, prefilling it on a miss."""
+        key = (model_cache_id(model), tuple(prefix_ids))
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return copy.deepcopy(entry[0])
+            self.misses += 1
+
+        import torch
+
+        with torch.inference_mode():
+            input_ids = torch.tensor([prefix_ids], device=model.device)
+            past = model(input_ids=input_ids, use_cache=True).past_key_values
+        size = self.entry_bytes(model, len(prefix_ids))
+        if size <= self.max_bytes:
+            with self._lock:
+                if key not in self._entries:
+                    self._entries[key] = (past, size)
+                    self._bytes += size
+                while self._bytes > self.max_bytes:
+                    _, (_, evicted) = self._entries.popitem(last=False)
+                    self._bytes -= evicted
+        return copy.deepcopy(past)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+@st.cache_resource
+def get_prefix_cache():
+    """Single prefix cache per server process, shared by every session."""
+    return PrefixKVCache(PREFIX_CACHE_MAX_MB * 1024 ** 2)
+
+
+def expand_past_key_values(past, batch_size):
+    """Repeat a batch-of-one past_key_values across ``batch_size`` rows."""
+    if batch_size == 1:
+        return past
+    if isinstance(past, tuple):
+        # Legacy tuple-of-(key, value) format
+        return tuple(tuple(t.repeat(batch_size, 1, 1, 1) for t in layer) for layer in past)
+    past.batch_repeat_interleave(batch_size)
+    return past
+
+
+class GenerationCache:
+    """On-disk LRU of deterministic completions, shared across sessions and restarts.
+
+    Completions are keyed by hash(model, prefix, prompt, decoding params) in a
+    SQLite table with a last-use tick, and the least recently used rows are
+    deleted once the table grows past ``max_entries``.
+    """
+
+    def __init__(self, path, max_entries=GENERATION_CACHE_MAX_ENTRIES):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS completions (key TEXT PRIMARY KEY, text TEXT NOT NULL, tick INTEGER NOT NULL)"
+        )
+        self._tick = self._conn.execute("SELECT COALESCE(MAX(tick), 0) FROM completions").fetchone()[0]
+
+    @staticmethod
+    def key(model_name, prefix, prompt, params):
+        payload = json.dumps([model_name, prefix, prompt, params], sort_keys=True).encode("utf-8")
+        return hashlib.blake2b(payload, digest_size=16).hexdigest()
+
+    def get(self, key):
+        """Return the stored completion or None."""
+        with self._lock:
+            row = self._conn.execute("SELECT text FROM completions WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            self._tick += 1
+            self._conn.execute("UPDATE completions SET tick = ? WHERE key = ?", (self._tick, key))
+            self._conn.commit()
+            return row[0]
+
+    def put(self, key, text):
+        with self._lock:
+            self._tick += 1
+            self._conn.execute(
+                "INSERT OR REPLACE INTO completions (key, text, tick) VALUES (?, ?, ?)", (key, text, self._tick)
+            )
+            self._conn.execute(
+                "DELETE FROM completions WHERE key NOT IN "
+                "(SELECT key FROM completions ORDER BY tick DESC LIMIT ?)",
+                (self.max_entries,),
+            )
+            self._conn.commit()
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        with self._lock:
+            entries = self._conn.execute("SELECT COUNT(*) FROM completions").fetchone()[0]
+        return {
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+@st.cache_resource
+def get_generation_cache():
+    """Persistent completion cache, shared across sessions"""
+    return GenerationCache(os.path.join(CACHE_DIR, "generations.sqlite"))
+
+
+@st.cache_resource
+def get_seeded_generation_lock():
+    """Seeded runs reset the global torch RNG, so they must not interleave."""
+    return threading.Lock()
+
+
+def decoding_params(max_new_tokens=MAX_NEW_TOKENS):
+    """Decoding parameters for this session's generation mode; also part of the cache key."""
+    mode = st.session_state.get("generation_mode", "sample")
+    if mode == "greedy":
+        return {"max_new_tokens": max_new_tokens, "do_sample": False}
+    params = {"max_new_tokens": max_new_tokens, "do_sample": True, "temperature": 0.7}
+    if mode == "seeded":
+        params["seed"] = GENERATION_SEED
+    elif mode == "best_of_n" and GENERATION_BEST_OF > 1:
+        params["best_of"] = GENERATION_BEST_OF
+    return params
+
+
+def is_deterministic(params):
+    return not params["do_sample"] or "seed" in params
+
+
+@contextmanager
+def generation_rng(params):
+    """Run the enclosed generation with a fixed RNG state when the params carry a seed."""
+    if "seed" not in params:
+        yield
+        return
+    import torch
+
+    with get_seeded_generation_lock(), torch.random.fork_rng(devices=[]):
+        torch.manual_seed(params["seed"])
+        yield
+
+
+def generate_kwargs(params):
+    """``generate`` keyword arguments for the decoding params."""
+    return {name: value for name, value in params.items() if name not in ("seed", "best_of")}
+
+
+def warm_text_generator():
+    """Load the text model and decode a couple of tokens so its weights are paged in."""
+    if INFERENCE_WORKER_ADDRESS:
+        # The worker owns the model; just check that it answers
+        worker_request({"op": "stats"})
+        return
+    import torch
+
+    generator = load_text_generator()
+    if generator is None:
+        raise RuntimeError("text generation model failed to load")
+    model, eos_id = generator.model, generator.tokenizer.eos_token_id
+    with torch.inference_mode():
+        input_ids = torch.full((1, 4), eos_id, dtype=torch.long, device=model.device)
+        model.generate(
+            input_ids=input_ids,
+            attention_mask=torch.ones_like(input_ids),
+            max_new_tokens=2,
+            do_sample=False,
+            pad_token_id=eos_id,
+        )
+
+
+def warm_embedding_model():
+    """Load the shared embedding model and encode one sentence."""
+    get_embedding_registry().get(EMBEDDING_MODEL_NAME).encode(["warm-up"], show_progress_bar=False)
+
+
+class ModelWarmup:
+    """Loads the models on a background thread and tracks how far along each one is.
+
+    Each step moves from "pending" to "loading" to "ready" (or "failed"), so
+    pages can report progress instead of blocking on the first model load.
+    """
+
+    STEPS = {"text_generator": warm_text_generator, "embedding_model": warm_embedding_model}
+    LABELS = {"text_generator": "Text model", "embedding_model": "Embedding model"}
+
+    def __init__(self):
+        self.status = {step: "pending" for step in self.STEPS}
+        self.errors = {}
+        self._thread = threading.Thread(target=self._run, name="tasker-model-warmup", daemon=True)
+
+    def start(self):
+        self._thread.start()
+        return self
+
+    def _run(self):
+        for step, warm in self.STEPS.items():
+            self.status[step] = "loading"
+            try:
+                warm()
+                self.status[step] = "ready"
+            except Exception as e:
+                self.errors[step] = str(e)
+                self.status[step] = "failed"
+
+    def progress(self):
+        """Fraction of steps that have finished, successfully or not."""
+        done = sum(state in ("ready", "failed") for state in self.status.values())
+        return done / len(self.status)
+
+    def is_ready(self, step=None):
+        if step is not None:
+            return self.status[step] == "ready"
+        return all(state == "ready" for state in self.status.values())
+
+
+@st.cache_resource
+def get_model_warmup():
+    """Start the warm-up once per server process, on the first page render."""
+    return ModelWarmup().start()
+
+
+def render_warmup_status():
+    """Sidebar progress for the background model warm-up."""
+    if not MODEL_WARMUP:
+        return
+    warmup = get_model_warmup()
+    if warmup.is_ready():
+        return
+    loading = [ModelWarmup.LABELS[step] for step, state in warmup.status.items() if state in ("pending", "loading")]
+    if loading:
+        st.sidebar.progress(warmup.progress(), text=f"Preparing AI models: {', '.join(loading)}...")
+    for step, error in warmup.errors.items():
+        st.sidebar.caption(f"{ModelWarmup.LABELS[step]} warm-up failed: {error}")
+
+
+def get_text_generator():
+    """Return the text generator for this session, loading the shared model on first use."""
+    if st.session_state["text_generator"] is None:
+        if MODEL_WARMUP and get_model_warmup().status["text_generator"] == "loading":
+            message = "Finishing AI model warm-up..."
+        else:
+            message = "Loading AI model (first time only, this may take a moment)..."
+        with st.spinner(message):
+            generator = load_text_generator()
+            if generator is None:
+                return None
+            st.session_state["text_generator"] = generator
+            st.session_state["model_loaded"] = True
+    return st.session_state["text_generator"]
+
+
+def max_prompt_tokens(generator, max_new_tokens=MAX_NEW_TOKENS):
+    """Prompt token budget that leaves room for ``max_new_tokens`` in the context window."""
+    # GPT-2 family supports ~1024 tokens context; keep prompt well under that.
+    max_ctx = (
+        getattr(generator.model.config, "n_positions", None)
+        or getattr(generator.model.config, "max_position_embeddings", 1024)
+        or 1024
+    )
+    return max(64, max_ctx - max_new_tokens - 8)
+
+
+def generate_from_model(prompt, prefix="", max_items=None, unit="sentence"):
+    """Generate text using local model.
+
+    ``prefix`` is shared context placed before the prompt; its prefill is
+    cached and reused by every prompt that starts with it. With ``max_items``,
+    decoding stops once that many complete ``unit``s (sentences or lines) exist.
+    """
+    return generate_batch_from_model([prompt], prefix=prefix, max_items=max_items, unit=unit)[0]
+
+
+class BatchTextStreamer:
+    """Receives new tokens from ``generate`` and hands out ``(row, text delta)`` pairs per batch row.
+
+    Implements the ``BaseStreamer`` interface (``put``/``end``) without
+    subclassing it, so defining it does not import transformers.
+    """
+
+    def __init__(self, tokenizer, batch_size):
+        self.tokenizer = tokenizer
+        self.tokens = [[] for _ in range(batch_size)]
+        self.printed = [0] * batch_size
+        self.queue = queue.Queue()
+        self._prompt_seen = False
+
+    def put(self, value):
+        # The first call carries the prompt ids, which are not part of the output
+        if not self._prompt_seen:
+            self._prompt_seen = True
+            return
+        for row, new_tokens in enumerate(value.reshape(len(self.tokens), -1).tolist()):
+            self.tokens[row].extend(new_tokens)
+            text = self.tokenizer.decode(self.tokens[row], skip_special_tokens=True)
+            # Hold back a trailing partial multi-byte character until it completes
+            if text.endswith("\ufffd") or len(text) <= self.printed[row]:
+                continue
+            self.queue.put((row, text[self.printed[row]:]))
+            self.printed[row] = len(text)
+
+    def end(self):
+        self.queue.put(None)
+
+    def fail(self, error):
+        self.queue.put(error)
+
+    def __iter__(self):
+        while True:
+            item = self.queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                raise item
+            yield item
+
+
+class CancelCriteria:
+    """``StoppingCriteria`` that stops decoding once ``event`` is set."""
+
+    def __init__(self, event):
+        self.event = event
+
+    def __call__(self, input_ids, scores, **kwargs):
+        # A plain bool works with both the bool- and tensor-returning StoppingCriteriaList
+        return self.event.is_set()
+
+
+def item_limits(max_items, n_prompts):
+    """Per-prompt item limits from one shared limit or a list (None when unlimited)."""
+    if max_items is None or isinstance(max_items, (list, tuple)):
+        return max_items
+    return [max_items] * n_prompts
+
+
+def cached_completions(model, prompts, prefix, params, limits=None, unit="sentence"):
+    """Look prompts up in the generation cache when ``params`` are deterministic.
+
+    Returns (cache or None, cache keys, completions with None for misses).
+    """
+    if not is_deterministic(params):
+        return None, [], [None] * len(prompts)
+    cache = get_generation_cache()
+    keys = [
+        cache.key(
+            model_cache_id(model), prefix, prompt,
+            {**params, "max_items": limits[pos] if limits else None, "unit": unit},
+        )
+        for pos, prompt in enumerate(prompts)
+    ]
+    return cache, keys, [cache.get(key) for key in keys]
+
+
+def early_stop_criteria(generator, inputs, limits, pending, unit):
+    """``EarlyStopCriteria`` for the pending rows of a batch built by ``encode_generation_batch``."""
+    return EarlyStopCriteria(
+        generator.tokenizer,
+        inputs["input_ids"].shape[1],
+        max_items=[limits[pos] for pos in pending] if limits else None,
+        unit=unit,
+    )
+
+
+def encode_generation_batch(generator, prompts, prefix, max_new_tokens):
+    """Tokenize prompts once into ``generate`` inputs.
+
+    Each prompt is truncated from the front to fit the context window and
+    followed by a blank line; rows are padded with the pad (eos) token after
+    the shared ``prefix``, whose past_key_values come from the prefix cache.
+    Returns the keyword arguments for ``model.generate``.
+    """
+    import torch
+
+    tokenizer, model = generator.tokenizer, generator.model
+    prompt_budget = max_prompt_tokens(generator, max_new_tokens)
+    separator = tokenizer.encode("\n\n", add_special_tokens=False)
+    rows = [
+        tokenizer.encode((prompt or "").strip(), add_special_tokens=False)[-(prompt_budget - len(separator)):]
+        + separator
+        for prompt in prompts
+    ]
+    width = max(len(row) for row in rows)
+    # Long prefixes give up their head so the prompts themselves always fit
+    room = prompt_budget - width
+    prefix_ids = tokenizer.encode(prefix, add_special_tokens=False)[-room:] if prefix and room > 0 else []
+
+    pad_id = tokenizer.pad_token_id
+    inputs = {
+        "input_ids": torch.tensor(
+            [prefix_ids + [pad_id] * (width - len(row)) + row for row in rows], device=model.device
+        ),
+        "attention_mask": torch.tensor(
+            [[1] * len(prefix_ids) + [0] * (width - len(row)) + [1] * len(row) for row in rows],
+            device=model.device,
+        ),
+        "pad_token_id": tokenizer.eos_token_id,
+    }
+    if prefix_ids:
+        past = get_prefix_cache().get(model, prefix_ids)
+        inputs["past_key_values"] = expand_past_key_values(past, len(rows))
+    return inputs
+
+
+def count_complete_items(text, unit):
+    """Count finished sentences (``unit="sentence"``) or lines (``unit="line"``) long enough to be kept.
+
+    JSON task lists (``unit="json"``) count closed task objects; strings in
+    them cannot hold a quote, so ``"]}`` only appears where a task ends.
+    """
+    if unit == "json":
+        return text.count('"]}')
+    if unit == "line":
+        return sum(len(line.strip()) > 10 for line in text.split("\n")[:-1])
+    return sum(len(sentence.strip()) > 15 for sentence in text.replace("\n", " ").split(".")[:-1])
+
+
+class EarlyStopCriteria:
+    """``StoppingCriteria`` for output that is post-processed down to a few items.
+
+    Decoding ends once every row has produced its ``max_items`` complete
+    sentences or lines, emitted eos, or started repeating its last
+    ``GENERATION_REPEAT_NGRAM`` tokens, or once ``deadline_s`` has passed.
+    JSON task lists (``unit="json"``) are closed by their grammar instead:
+    they only stop on eos, and the deadline just tells the logits processor
+    to wrap the list up.
+    Returns a plain bool, which both the bool- and tensor-returning
+    ``StoppingCriteriaList`` accept; the batch therefore stops as a whole.
+    """
+
+    def __init__(self, tokenizer, prompt_length, max_items=None, unit="sentence", deadline_s=GENERATION_DEADLINE_S):
+        self.tokenizer = tokenizer
+        self.prompt_length = prompt_length
+        self.max_items = max_items
+        self.unit = unit
+        self.deadline = time.monotonic() + deadline_s if deadline_s else None
+        self.deadline_hit = False
+
+    def _repeating(self, ids):
+        n = GENERATION_REPEAT_NGRAM
+        if len(ids) < 2 * n:
+            return False
+        tail = ids[-n:]
+        return any(ids[start:start + n] == tail for start in range(len(ids) - 2 * n + 1))
+
+    def _row_done(self, row, ids):
+        if self.tokenizer.eos_token_id in ids:
+            return True
+        if self.unit == "json":
+            # The scaffold repeats by design, and cutting it short would leave invalid JSON
+            return False
+        if self._repeating(ids):
+            return True
+        limit = self.max_items[row] if self.max_items is not None else None
+        if not limit:
+            return False
+        return count_complete_items(self.tokenizer.decode(ids, skip_special_tokens=True), self.unit) >= limit
+
+    def __call__(self, input_ids, scores, **kwargs):
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.deadline_hit = True
+            if self.unit != "json":
+                return True
+        rows = input_ids[:, self.prompt_length:].tolist()
+        return all(self._row_done(row, ids) for row, ids in enumerate(rows))
+
+
+class TaskJSONGrammar:
+    """Token-level pieces of the JSON task list grammar for one tokenizer.
+
+    Output always has the shape
+    ``[{"title": "...", "phase": "<TASK_PHASES>", "skills": ["...", ...]}, ...]``.
+    Structural text is tokenized once into literals, and ``string_ok`` marks
+    the tokens that can sit inside a JSON string without escaping.
+    """
+
+    def __init__(self, tokenizer):
+        def encode(text):
+            return tuple(tokenizer.encode(text, add_special_tokens=False))
+
+        self.open = encode('[{"title": "')
+        self.after_title = encode('", "phase": "')
+        self.phases = [encode(f'{phase}", "skills": ["') for phase in TASK_PHASES]
+        self.next_skill = encode('", "')
+        self.close_task = encode('"]}')
+        self.next_task = encode(', {"title": "')
+        self.close_list = encode("]")
+        self.eos_id = tokenizer.eos_token_id
+        special = set(tokenizer.all_special_ids)
+        texts = tokenizer.batch_decode([[i] for i in range(len(tokenizer))], clean_up_tokenization_spaces=False)
+        self.string_ok = np.array(
+            [
+                i not in special
+                and bool(text)
+                and '"' not in text
+                and "\\" not in text
+                and "\ufffd" not in text
+                and min(text) >= " "
+                for i, text in enumerate(texts)
+            ],
+            dtype=bool,
+        )
+        # Tokens it takes to close the list from the worst state: mid-title of an unfinished task
+        self.closing_reserve = (
+            TASK_JSON_TITLE_TOKENS + len(self.after_title) + max(map(len, self.phases))
+            + TASK_JSON_SKILL_TOKENS + len(self.close_task) + len(self.close_list) + 1
+        )
+
+
+@st.cache_resource
+def get_task_json_grammar(model_id, _tokenizer):
+    """Grammar tables per model; building them decodes the whole vocabulary once."""
+    return TaskJSONGrammar(_tokenizer)
+
+
+class TaskJSONLogitsProcessor:
+    """``LogitsProcessor`` that only lets each row emit a JSON task list.
+
+    Implements the ``LogitsProcessor`` call signature without subclassing it.
+    Each row walks ``TaskJSONGrammar``: structural literals are forced token by
+    token, strings take ``string_ok`` tokens up to a length cap, and phases
+    are limited to TASK_PHASES. A row closes its list after ``max_items``
+    tasks, and every row starts closing once the token budget runs low or
+    ``stop`` reports the deadline, so the output always parses.
+    """
+
+    STRING_TOKENS = {"title": TASK_JSON_TITLE_TOKENS, "skill": TASK_JSON_SKILL_TOKENS}
+
+    def __init__(self, grammar, prompt_length, max_new_tokens, max_items=None, stop=None):
+        self.grammar = grammar
+        self.prompt_length = prompt_length
+        self.budget = max_new_tokens - grammar.closing_reserve
+        self.max_items = max_items
+        self.stop = stop
+        self.rows = None
+        self.seen = 0
+        self._string_masks = {}
+
+    def _alternatives(self, row, closing):
+        """``(literal, next node)`` pairs that may follow the row's current node."""
+        g, node = self.grammar, row["node"]
+        if node == "title":
+            return [(g.after_title, "phase")]
+        if node == "phase":
+            return [(literal, "skill") for literal in g.phases]
+        if node == "skill":
+            more = row["skills"] < TASK_JSON_MAX_SKILLS and not closing
+            return ([(g.next_skill, "skill")] if more else []) + [(g.close_task, "task_end")]
+        limit = self.max_items[row["index"]] if self.max_items is not None else None
+        more = (not limit or row["tasks"] < limit) and not closing
+        return ([(g.next_task, "title")] if more else []) + [(g.close_list, "done")]
+
+    def _enter(self, row, node, closing):
+        row.update(node=node, length=0, literals=None, pos=0)
+        if node == "title":
+            row["skills"] = 0
+        elif node == "skill":
+            row["skills"] += 1
+        elif node == "task_end":
+            row["tasks"] += 1
+        if node in ("phase", "task_end"):
+            row["literals"] = self._alternatives(row, closing)
+
+    def _advance(self, row, token, closing):
+        if row["node"] == "done":
+            return
+        if row["literals"] is None:
+            # Inside a string: either one more string token or the first token of what follows it
+            matches = [(literal, nxt) for literal, nxt in row["offered"] if literal[0] == token]
+            if not matches:
+                row["length"] += 1
+                return
+            row["literals"], row["pos"] = matches, 0
+        pos = row["pos"]
+        row["literals"] = [(literal, nxt) for literal, nxt in row["literals"] if literal[pos] == token]
+        row["pos"] = pos + 1
+        finished = [nxt for literal, nxt in row["literals"] if len(literal) == row["pos"]]
+        if finished or not row["literals"]:
+            self._enter(row, finished[0] if finished else "done", closing)
+
+    def _allowed(self, row, closing):
+        """(whether string tokens are allowed, other allowed token ids)."""
+        if row["node"] == "done":
+            return False, [self.grammar.eos_id]
+        if row["literals"] is not None:
+            return False, sorted({literal[row["pos"]] for literal, _ in row["literals"]})
+        row["offered"] = self._alternatives(row, closing)
+        length, cap = row["length"], self.STRING_TOKENS[row["node"]]
+        # Strings hold at least one token; closing rows end theirs as soon as they may
+        strings = length < cap and not (closing and length > 0)
+        return strings, sorted({literal[0] for literal, _ in row["offered"]}) if length > 0 else []
+
+    def _string_mask(self, scores):
+        key = (scores.shape[-1], scores.device)
+        if key not in self._string_masks:
+            import torch
+
+            ok = np.zeros(scores.shape[-1], dtype=bool)
+            size = min(len(ok), len(self.grammar.string_ok))
+            ok[:size] = self.grammar.string_ok[:size]
+            self._string_masks[key] = torch.from_numpy(ok).to(scores.device)
+        return self._string_masks[key]
+
+    def __call__(self, input_ids, scores):
+        # No **kwargs: LogitsProcessorList would then insist on being given extra arguments
+        import torch
+
+        generated = input_ids.shape[1] - self.prompt_length
+        closing = generated >= self.budget or (self.stop is not None and self.stop.deadline_hit)
+        if self.rows is None:
+            self.rows = [
+                {"index": index, "node": "start", "literals": [(self.grammar.open, "title")], "pos": 0,
+                 "length": 0, "tasks": 0, "skills": 0}
+                for index in range(input_ids.shape[0])
+            ]
+        for step in input_ids[:, self.prompt_length + self.seen:].T.tolist():
+            for row, token in zip(self.rows, step):
+                self._advance(row, token, closing)
+        self.seen = generated
+
+        allowed = torch.zeros_like(scores, dtype=torch.bool)
+        for index, row in enumerate(self.rows):
+            strings, ids = self._allowed(row, closing)
+            if strings:
+                allowed[index] = self._string_mask(scores)
+            allowed[index, ids] = True
+        return scores.masked_fill(~allowed, float("-inf"))
+
+
+def parse_task_json(text):
+    """``{"title", "phase", "skills"}`` dicts from a JSON task list completion.
+
+    The grammar makes every complete completion valid JSON; one cut short
+    (e.g. by the Stop button) yields no tasks.
+    """
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        return []
+    tasks = []
+    for item in items:
+        title = " ".join(item["title"].split())
+        if title:
+            skills = [" ".join(skill.split()) for skill in item["skills"]]
+            tasks.append({"title": title, "phase": item["phase"], "skills": [skill for skill in skills if skill]})
+    return tasks
+
+
+def unit_max_new_tokens(unit):
+    """New-token budget for a generation unit."""
+    return TASK_JSON_MAX_NEW_TOKENS if unit == "json" else MAX_NEW_TOKENS
+
+
+def generation_constraints(generator, inputs, limits, pending, params, unit, early_stop):
+    """Extra ``generate`` kwargs for the unit: the grammar's logits processor for JSON task lists."""
+    if unit != "json":
+        return {}
+    from transformers import LogitsProcessorList
+
+    tokenizer = generator.tokenizer
+    processor = TaskJSONLogitsProcessor(
+        get_task_json_grammar(model_cache_id(generator.model), tokenizer),
+        inputs["input_ids"].shape[1],
+        params["max_new_tokens"],
+        max_items=[limits[pos] for pos in pending] if limits else None,
+        stop=early_stop,
+    )
+    return {"logits_processor": LogitsProcessorList([processor])}
+
+
+def repeated_trigram_fraction(text):
+    """Share of the word trigrams in ``text`` that already occurred earlier in it."""
+    words = text.lower().split()
+    trigrams = list(zip(words, words[1:], words[2:]))
+    return 1 - len(set(trigrams)) / len(trigrams) if trigrams else 0.0
+
+
+def pick_best_samples(samples, n, references, unit="sentence"):
+    """Best of every ``n`` consecutive samples, one per entry of ``references``.
+
+    Samples are scored by the embedding similarity of their content to their
+    reference (the shared prompt context) minus BEST_OF_REPETITION_PENALTY
+    times their repeated-trigram fraction; empty samples never win. All
+    samples are embedded in one batch.
+    """
+    if n == 1:
+        return list(samples)
+    if unit == "json":
+        contents = ["; ".join(task["title"] for task in parse_task_json(text)) for text in samples]
+    else:
+        contents = list(samples)
+    scores = -BEST_OF_REPETITION_PENALTY * np.array([repeated_trigram_fraction(text) for text in contents])
+    try:
+        embeddings = encode_texts(list(references) + contents)
+        reference_embeddings = embeddings[:len(references)]
+        sample_embeddings = embeddings[len(references):].reshape(len(references), n, -1)
+        scores += np.einsum("knd,kd->kn", sample_embeddings, reference_embeddings).ravel()
+    except Exception:
+        # Runs in the inference worker too, so there is no page to warn on; rank on repetition alone
+        pass
+    scores[[not text.strip() for text in contents]] = -np.inf
+    best = scores.reshape(-1, n).argmax(axis=1)
+    return [samples[row * n + pick] for row, pick in enumerate(best.tolist())]
+
+
+def stream_batch_from_model(prompts, prefix="", max_items=None, unit="sentence"):
+    """Yield ``(row, text delta)`` pairs while one batched ``generate`` call decodes ``prompts``.
+
+    Inputs and early stopping work like ``generate_batch_from_model`` and only
+    new tokens are streamed. In a deterministic generation mode, cached
+    completions are yielded whole and skip the model.
+
+    Decoding runs on a worker thread; closing the generator early (e.g. when a
+    Stop click reruns the script) cancels it. The inference worker returns
+    whole completions, so with ``TASKER_INFERENCE_WORKER`` set each row
+    arrives as a single delta. The same holds in best-of-n mode, where the
+    winning sample is only known once every sample has finished.
+    """
+    try:
+        if INFERENCE_WORKER_ADDRESS:
+            texts = request_worker_completions(
+                prompts, prefix, decoding_params(unit_max_new_tokens(unit)), max_items, unit
+            )
+            for pos, text in enumerate(texts):
+                if text:
+                    yield pos, text
+            return
+
+        generator = get_text_generator()
+        if generator is None:
+            return
+
+        import torch
+        from transformers import StoppingCriteriaList
+
+        params = decoding_params(unit_max_new_tokens(unit))
+        limits = item_limits(max_items, len(prompts))
+        cache, cache_keys, cached = cached_completions(generator.model, prompts, prefix, params, limits, unit)
+        for pos, text in enumerate(cached):
+            if text:
+                yield pos, text
+        pending = [pos for pos, text in enumerate(cached) if text is None]
+        if not pending:
+            return
+
+        # Best-of-n decodes n rows per prompt in the same batch
+        n = params.get("best_of", 1)
+        rows = [pos for pos in pending for _ in range(n)]
+        inputs = encode_generation_batch(generator, [prompts[pos] for pos in rows], prefix, params["max_new_tokens"])
+        streamer = BatchTextStreamer(generator.tokenizer, len(rows))
+        cancel = threading.Event()
+        early_stop = early_stop_criteria(generator, inputs, limits, rows, unit)
+        constraints = generation_constraints(generator, inputs, limits, rows, params, unit, early_stop)
+
+        def decode():
+            try:
+                with torch.inference_mode(), generation_rng(params):
+                    generator.model.generate(
+                        streamer=streamer,
+                        stopping_criteria=StoppingCriteriaList([CancelCriteria(cancel), early_stop]),
+                        **inputs,
+                        **constraints,
+                        **generate_kwargs(params),
+                    )
+            except Exception as e:
+                streamer.fail(e)
+
+        worker = threading.Thread(target=decode, daemon=True)
+        worker.start()
+        texts = [""] * len(rows)
+        try:
+            for row, delta in streamer:
+                texts[row] += delta
+                if n == 1:
+                    yield rows[row], delta
+        finally:
+            cancel.set()
+            worker.join()
+        if n > 1:
+            texts = pick_best_samples(texts, n, [prefix or prompts[pos] for pos in pending], unit)
+            for pos, text in zip(pending, texts):
+                if text:
+                    yield pos, text
+        # Output cut short by the deadline depends on machine load, so it is not cached
+        if cache is not None and not early_stop.deadline_hit:
+            for pos, text in zip(pending, texts):
+                cache.put(cache_keys[pos], text.strip())
     except Exception as e:
         st.error(f"Error generating text: {e}")
-        return ""
+
+
+def stream_from_model(prompt, prefix="", max_items=None, unit="sentence"):
+    """Yield text deltas of a single generation as they decode; see ``stream_batch_from_model``."""
+    for _, delta in stream_batch_from_model([prompt], prefix=prefix, max_items=max_items, unit=unit):
+        yield delta
+
+
+def complete_batch(generator, prompts, prefix, params, max_items=None, unit="sentence"):
+    """Cached, batched completions for ``prompts`` under explicit decoding ``params``.
+
+    Shared by ``generate_batch_from_model`` and the inference worker, so it
+    reads no session state.
+    """
+    import torch
+    from transformers import StoppingCriteriaList
+
+    limits = item_limits(max_items, len(prompts))
+    cache, cache_keys, results = cached_completions(generator.model, prompts, prefix, params, limits, unit)
+    pending = [pos for pos, text in enumerate(results) if text is None]
+    if not pending:
+        return results
+
+    # Best-of-n decodes n rows per prompt in the same batch
+    n = params.get("best_of", 1)
+    rows = [pos for pos in pending for _ in range(n)]
+    inputs = encode_generation_batch(generator, [prompts[pos] for pos in rows], prefix, params["max_new_tokens"])
+    early_stop = early_stop_criteria(generator, inputs, limits, rows, unit)
+    constraints = generation_constraints(generator, inputs, limits, rows, params, unit, early_stop)
+    with torch.inference_mode(), generation_rng(params):
+        output = generator.model.generate(
+            stopping_criteria=StoppingCriteriaList([early_stop]),
+            **inputs,
+            **constraints,
+            **generate_kwargs(params),
+        )
+    new_tokens = output[:, inputs["input_ids"].shape[1]:]
+    texts = generator.tokenizer.batch_decode(new_tokens, skip_special_tokens=True)
+    texts = pick_best_samples(texts, n, [prefix or prompts[pos] for pos in pending], unit)
+    for pos, text in zip(pending, texts):
+        results[pos] = text.strip()
+        if cache is not None and not early_stop.deadline_hit:
+            cache.put(cache_keys[pos], results[pos])
+    return results
+
+
+def inference_worker_authkey(create=False):
+    """Shared secret authenticating app and inference worker to each other.
+
+    Both ends unpickle what they receive, so the key is what stands between a
+    caller and code execution in the worker, and there is no built-in default.
+    ``TASKER_INFERENCE_WORKER_KEY`` is used when set. Otherwise the key is a
+    random one in a mode-0600 file under CACHE_DIR, written by the worker on
+    first start (``create=True``) and read by apps running as the same user.
+    """
+    if INFERENCE_WORKER_KEY:
+        return INFERENCE_WORKER_KEY.encode("utf-8")
+    path = os.path.join(CACHE_DIR, "inference_worker.key")
+    if create and not os.path.exists(path):
+        os.makedirs(CACHE_DIR, exist_ok=True)
+        # Write a private temp file, then link it into place so readers never see a partial key
+        temp = f"{path}.{os.getpid()}"
+        with os.fdopen(os.open(temp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600), "w") as f:
+            f.write(secrets.token_hex(32))
+        try:
+            os.link(temp, path)
+        except FileExistsError:
+            pass  # Another worker created it first
+        finally:
+            os.remove(temp)
+    try:
+        mode = os.stat(path).st_mode
+    except FileNotFoundError:
+        raise RuntimeError(
+            f"no inference worker key: set TASKER_INFERENCE_WORKER_KEY or start inference_worker.py, "
+            f"which writes {path}"
+        ) from None
+    if os.name == "posix" and mode & 0o077:
+        raise RuntimeError(f"{path} is accessible to other users; restrict it with chmod 600")
+    with open(path) as f:
+        return f.read().strip().encode("utf-8")
+
+
+def worker_request(message):
+    """Send one request to the inference worker and return its reply."""
+    from multiprocessing.connection import Client
+
+    host, port = INFERENCE_WORKER_ADDRESS.rsplit(":", 1)
+    with Client((host, int(port)), authkey=inference_worker_authkey()) as conn:
+        conn.send(message)
+        reply = conn.recv()
+    if "error" in reply:
+        raise RuntimeError(f"inference worker: {reply['error']}")
+    return reply
+
+
+def request_worker_completions(prompts, prefix, params, max_items=None, unit="sentence"):
+    """``complete_batch`` run by the inference worker, batched with other sessions' requests."""
+    message = {
+        "op": "generate",
+        "prompts": list(prompts),
+        "prefix": prefix,
+        "params": params,
+        "max_items": item_limits(max_items, len(prompts)),
+        "unit": unit,
+    }
+    return worker_request(message)["texts"]
+
+
+def generate_batch_from_model(prompts, prefix="", max_items=None, unit="sentence"):
+    """Generate a continuation for every prompt in a single batched ``generate`` call.
+
+    Works on token ids end to end: prompts are tokenized once, the model
+    decodes all rows together, and only the new tokens of each row are
+    decoded back to text. A shared ``prefix`` is prefilled once (or taken from
+    the prefix cache). In a deterministic generation mode, prompts already in
+    the generation cache skip the model. In best-of-n mode each prompt is
+    decoded ``GENERATION_BEST_OF`` times within the batch and the sample
+    ranked best by ``pick_best_samples`` is returned. With
+    ``TASKER_INFERENCE_WORKER`` set, the same work is done by the worker
+    process instead.
+
+    ``max_items`` (one limit, or one per prompt) stops decoding once every row
+    has that many complete ``unit``s, "sentence" or "line"; decoding also stops
+    when output starts repeating or ``GENERATION_DEADLINE_S`` passes. With
+    ``unit="json"`` every row is a JSON task list of at most ``max_items``
+    tasks (see ``TaskJSONLogitsProcessor``), ready for ``parse_task_json``.
+    """
+    try:
+        params = decoding_params(unit_max_new_tokens(unit))
+        if INFERENCE_WORKER_ADDRESS:
+            return request_worker_completions(prompts, prefix, params, max_items, unit)
+        generator = get_text_generator()
+        if generator is None:
+            return [None] * len(prompts)
+        return complete_batch(generator, prompts, prefix, params, max_items, unit)
+    except Exception as e:
+        st.error(f"Error generating text: {e}")
+        return [""] * len(prompts)
+
+
+def render_generation_stream(stream, labels, stop_key):
+    """Show each row of a ``stream_batch_from_model`` stream under its label as it decodes.
+
+    A Stop button is rendered first: clicking it reruns the script, which
+    closes the stream and cancels the decode. The preview is cleared once the
+    stream finishes and the full texts are returned.
+    """
+    st.button("⏹ Stop generating", key=stop_key)
+    preview = st.empty()
+    texts = [""] * len(labels)
+    with preview.container():
+        placeholders = [st.empty() for _ in labels]
+    try:
+        for row, delta in stream:
+            texts[row] += delta
+            placeholders[row].caption(f"**{labels[row]}** {texts[row]}▌")
+    finally:
+        stream.close()
+    preview.empty()
+    return [text.strip() for text in texts]
+
+
+def prd_context(project_name, project_description):
+    """Project context shared as the cached prefix of every PRD section prompt."""
+    return f"Project: {project_name}\nDescription: {project_description}\n\n"
+
+
+def prd_section_prompts(project_name):
+    """Prompts for the overview, features and tools sections of a PRD."""
+    return [
+        f"Product Requirements Document for {project_name}. Overview:",
+        f"Key features and functionalities for {project_name}:",
+        f"Technologies, tools, and frameworks needed for {project_name}:",
+    ]
+
+
+# --- Project type rules ---
+# Declarative keyword rules behind the PRD defaults and the task plan. Each rule
+# applies when any of its "when" alternatives holds; an alternative needs one
+# keyword from every "all" group and none of its "none" keywords. Keywords match
+# as lowercase substrings of the text; "name:" keywords match the project name.
+# Rules without "when" are the fallback. Lists are tried in order, first match wins.
+PRD_FEATURE_RULES = [
+    {
+        "name": "ai_chatbot",
+        "when": [{"all": [("chatbot", "ai")]}],
+        "features": [
+            "Natural language processing and understanding capabilities",
+            "Conversational user interface with context awareness",
+            "Integration with knowledge base and FAQ system",
+            "Multi-channel support (web, mobile, API)",
+        ],
+    },
+    {
+        "name": "ecommerce",
+        "when": [{"all": [("e-commerce", "shopping")]}],
+        "features": [
+            "Product catalog with search and filtering",
+            "Shopping cart and checkout system",
+            "Secure payment gateway integration",
+            "Order management and tracking system",
+        ],
+    },
+    {
+        "name": "ios",
+        "when": [{"all": [("ios", "iphone", "ipad")]}],
+        "features": [
+            "Native iOS application with Swift/SwiftUI",
+            "iOS Human Interface Guidelines compliance",
+            "App Store integration and submission",
+            "Core Data or CloudKit for data persistence",
+            "Push notifications via APNs",
+        ],
+    },
+    {
+        "name": "android",
+        "when": [{"all": [("android",)], "none": ("ios", "iphone")}],
+        "features": [
+            "Native Android application with Kotlin/Java",
+            "Material Design guidelines compliance",
+            "Google Play Store integration",
+            "Room or SQLite for local database",
+            "Firebase Cloud Messaging for push notifications",
+        ],
+    },
+    {
+        "name": "native_mobile",
+        "when": [{"all": [("mobile", "app"), ("native", "swift", "kotlin")]}],
+        "features": [
+            "Native mobile application",
+            "Platform-specific UI/UX",
+            "App store integration",
+            "Local data persistence",
+        ],
+    },
+    {
+        "name": "cross_platform_mobile",
+        "when": [{"all": [("mobile", "app")]}],
+        "features": [
+            "Cross-platform mobile application (iOS/Android)",
+            "Offline functionality and data synchronization",
+            "Push notifications for updates and reminders",
+            "User authentication and profile management",
+        ],
+    },
+    {
+        "name": "generic",
+        "features": [
+            "User-friendly and intuitive interface",
+            "Core functionality as per requirements",
+            "Data management and storage system",
+            "Security and authentication mechanisms",
+        ],
+    },
+]
+
+CROSS_PLATFORM_TOOLS = [
+    "React Native or Flutter for cross-platform development",
+    "Firebase or AWS for backend services",
+    "SQLite or Realm for local database",
+    "RESTful API for server communication",
+]
+PRD_TOOL_RULES = [
+    {
+        "name": "ios",
+        "when": [{"all": [("ios", "iphone", "ipad")]}, {"all": [("native",), ("name:ios",)]}],
+        "tools": [
+            "Xcode - Apple's integrated development environment (IDE)",
+            "Swift programming language for iOS development",
+            "SwiftUI or UIKit for user interface development",
+            "Core Data or CloudKit for data persistence",
+            "CocoaPods or Swift Package Manager for dependency management",
+            "TestFlight for beta testing",
+            "App Store Connect for app distribution",
+        ],
+    },
+    {
+        "name": "android",
+        "when": [{"all": [("android",)], "none": ("ios", "iphone")}, {"all": [("native",), ("name:android",)]}],
+        "tools": [
+            "Android Studio - Official Android IDE",
+            "Kotlin or Java programming language",
+            "Jetpack Compose or XML layouts for UI",
+            "Room or SQLite for local database",
+            "Gradle for build automation and dependency management",
+            "Google Play Console for app distribution",
+            "Firebase for backend services (optional)",
+        ],
+    },
+    {
+        "name": "cross_platform",
+        "when": [{"all": [("react native", "flutter", "cross-platform")], "none": ("native",)}],
+        "tools": CROSS_PLATFORM_TOOLS,
+    },
+    {
+        "name": "native_ios_mobile",
+        "when": [{"all": [("mobile", "app"), ("native", "swift", "xcode")]}],
+        "tools": [
+            "Xcode and Swift for iOS development",
+            "SwiftUI or UIKit framework",
+            "Core Data for local storage",
+            "App Store Connect for distribution",
+        ],
+    },
+    {
+        "name": "native_android_mobile",
+        "when": [{"all": [("mobile", "app"), ("kotlin", "android studio")]}],
+        "tools": [
+            "Android Studio and Kotlin for Android development",
+            "Jetpack Compose or XML layouts",
+            "Room database for local storage",
+            "Google Play Console for distribution",
+        ],
+    },
+    {
+        "name": "cross_platform_mobile",
+        "when": [{"all": [("mobile", "app")]}],
+        "tools": CROSS_PLATFORM_TOOLS,
+    },
+    {
+        "name": "web",
+        "when": [{"all": [("web", "website")]}],
+        "tools": [
+            "React.js or Vue.js for frontend framework",
+            "Node.js or Python Django/Flask for backend",
+            "PostgreSQL or MongoDB for database",
+            "Docker for containerization and deployment",
+        ],
+    },
+    {
+        "name": "ai_chatbot",
+        "when": [{"all": [("ai", "chatbot")]}],
+        "tools": [
+            "Python with TensorFlow or PyTorch for ML models",
+            "NLTK or spaCy for NLP processing",
+            "FastAPI or Flask for API development",
+            "Vector database (Pinecone/Weaviate) for embeddings",
+        ],
+    },
+    {
+        "name": "generic",
+        "tools": [
+            "Modern web framework (React/Vue/Angular)",
+            "Backend API framework (Node.js/Python/Java)",
+            "Database system (PostgreSQL/MySQL/MongoDB)",
+            "Cloud hosting platform (AWS/Azure/GCP)",
+        ],
+    },
+]
+
+WEB_RELEASE_TASKS = [
+    "Perform code review and refactoring",
+    "Set up CI/CD pipeline",
+    "Deploy to staging environment",
+    "Perform user acceptance testing (UAT)",
+    "Deploy to production environment",
+    "Set up monitoring and logging",
+]
+# Task plan per platform: setup, development and release tasks, plus PRD tools whose setup the platform already covers
+TASK_PLATFORM_RULES = [
+    {
+        "name": "ios",
+        "when": [{"all": [("ios", "iphone", "ipad", "xcode", "swift")]}],
+        "setup_tasks": [
+            "Install and configure Xcode development environment",
+            "Set up Apple Developer account and certificates",
+            "Create new Xcode project with Swift/SwiftUI",
+            "Configure project settings (bundle ID, version, etc.)",
+        ],
+        "skip_tools": ("xcode",),
+        "development_tasks": [
+            "Design iOS UI/UX following Human Interface Guidelines",
+            "Implement SwiftUI views or UIKit components",
+            "Set up Core Data or CloudKit for data persistence",
+            "Configure App Store Connect and app metadata",
+            "Implement push notifications using APNs",
+            "Add app icons and launch screens for all device sizes",
+        ],
+        "release_tasks": [
+            "Test on iOS Simulator and physical devices",
+            "Configure TestFlight for beta testing",
+            "Submit app for App Store review",
+            "Set up App Store analytics and crash reporting",
+        ],
+    },
+    {
+        "name": "android",
+        "when": [{"all": [("android", "kotlin")]}],
+        "setup_tasks": [
+            "Install and configure Android Studio",
+            "Set up Android SDK and required tools",
+            "Create new Android project with Kotlin/Java",
+            "Configure app manifest and build.gradle",
+        ],
+        "skip_tools": ("android studio",),
+        "development_tasks": [
+            "Design Android UI/UX following Material Design guidelines",
+            "Implement Jetpack Compose or XML layouts",
+            "Set up Room database or SQLite for local storage",
+            "Configure Google Play Console and app listing",
+            "Implement Firebase Cloud Messaging for push notifications",
+            "Add app icons and adaptive icons for different densities",
+        ],
+        "release_tasks": [
+            "Test on Android emulator and physical devices",
+            "Set up internal testing track in Google Play Console",
+            "Submit app for Google Play Store review",
+            "Configure Google Play Console analytics",
+        ],
+    },
+    {
+        "name": "cross_platform",
+        "when": [{"all": [("react native", "flutter", "cross-platform")]}],
+        "setup_tasks": [
+            "Set up React Native or Flutter development environment",
+            "Initialize cross-platform project structure",
+            "Configure platform-specific settings",
+        ],
+        "release_tasks": WEB_RELEASE_TASKS,
+    },
+    {
+        "name": "web",
+        "setup_tasks": ["Set up development environment and tools"],
+        "release_tasks": WEB_RELEASE_TASKS,
+    },
+]
+# Capability tasks: every matching rule applies, optionally only on some platforms
+TASK_CAPABILITY_RULES = [
+    {
+        "name": "frontend",
+        "when": [{"all": [("frontend", "ui", "interface")]}],
+        "platforms": ("cross_platform", "web"),
+        "tasks": [
+            "Design user interface mockups and wireframes",
+            "Implement responsive frontend components",
+            "Integrate frontend with backend APIs",
+        ],
+    },
+    {
+        "name": "backend",
+        "when": [{"all": [("backend", "api")]}],
+        "tasks": [
+            "Design and develop RESTful API endpoints",
+            "Implement API authentication and authorization",
+            "Create API documentation",
+        ],
+    },
+    {
+        "name": "database",
+        "when": [{"all": [("database", "data")]}],
+        "tasks": [
+            "Design database schema and relationships",
+            "Implement database migrations",
+            "Set up database indexing and optimization",
+        ],
+    },
+    {
+        "name": "security",
+        "when": [{"all": [("authentication", "security")]}],
+        "tasks": [
+            "Implement user authentication system",
+            "Add security measures and data encryption",
+            "Set up role-based access control",
+        ],
+    },
+]
+PROJECT_RULE_TABLES = (PRD_FEATURE_RULES, PRD_TOOL_RULES, TASK_PLATFORM_RULES, TASK_CAPABILITY_RULES)
+
+
+class KeywordMatcher:
+    """Aho-Corasick automaton that finds which of a fixed set of keywords occur in a text.
+
+    Matches are plain substrings, like ``keyword in text``, but every keyword
+    is found in a single pass over the text.
+    """
+
+    def __init__(self, keywords):
+        self.keywords = frozenset(keywords)
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [frozenset()]
+        for keyword in self.keywords:
+            state = 0
+            for ch in keyword:
+                if ch not in self._goto[state]:
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append(frozenset())
+                    self._goto[state][ch] = len(self._goto) - 1
+                state = self._goto[state][ch]
+            self._out[state] = self._out[state] | {keyword}
+        # Breadth-first failure links; each state also reports the keywords of its failure chain
+        frontier = list(self._goto[0].values())
+        while frontier:
+            next_frontier = []
+            for state in frontier:
+                for ch, child in self._goto[state].items():
+                    fallback = self._fail[state]
+                    while fallback and ch not in self._goto[fallback]:
+                        fallback = self._fail[fallback]
+                    self._fail[child] = self._goto[fallback].get(ch, 0)
+                    self._out[child] = self._out[child] | self._out[self._fail[child]]
+                    next_frontier.append(child)
+            frontier = next_frontier
+
+    def find(self, text):
+        """Set of keywords occurring anywhere in ``text``."""
+        goto, fail, out = self._goto, self._fail, self._out
+        found = set()
+        state = 0
+        for ch in text:
+            while state and ch not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+                if len(found) == len(self.keywords):
+                    break
+        return found
+
+
+def rule_keywords(rule):
+    for alternative in rule.get("when", ()):
+        for group in alternative.get("all", ()):
+            yield from group
+        yield from alternative.get("none", ())
+
+
+@st.cache_resource
+def get_project_keyword_matcher():
+    """One automaton over every keyword in the project rule tables"""
+    keywords = {
+        keyword.split(":", 1)[-1]
+        for table in PROJECT_RULE_TABLES
+        for rule in table
+        for keyword in rule_keywords(rule)
+    }
+    return KeywordMatcher(keywords)
+
+
+def rule_applies(rule, matched):
+    """Whether ``rule`` holds for the ``matched`` keyword set (rules without "when" always do)."""
+    if "when" not in rule:
+        return True
+    return any(
+        all(matched.intersection(group) for group in alternative.get("all", ()))
+        and not matched.intersection(alternative.get("none", ()))
+        for alternative in rule["when"]
+    )
+
+
+def first_applicable_rule(rules, matched):
+    return next(rule for rule in rules if rule_applies(rule, matched))
+
+
+def detect_project_profile(text, project_name=""):
+    """Platform flags plus default feature, tool and task bundles for a description or PRD.
+
+    ``text`` and ``project_name`` are each scanned once; the rule tables then
+    only do set lookups.
+    """
+    matcher = get_project_keyword_matcher()
+    matched = matcher.find(text.lower())
+    matched |= {f"name:{keyword}" for keyword in matcher.find(project_name.lower())}
+    platform = first_applicable_rule(TASK_PLATFORM_RULES, matched)
+    return {
+        "keywords": matched,
+        "flags": {rule["name"]: rule_applies(rule, matched) for rule in TASK_PLATFORM_RULES if "when" in rule},
+        "platform": platform["name"],
+        "features": first_applicable_rule(PRD_FEATURE_RULES, matched)["features"],
+        "tools": first_applicable_rule(PRD_TOOL_RULES, matched)["tools"],
+        "setup_tasks": platform.get("setup_tasks", []),
+        "development_tasks": platform.get("development_tasks", []),
+        "release_tasks": platform.get("release_tasks", []),
+        "skip_tools": platform.get("skip_tools", ()),
+        "capability_tasks": [
+            task
+            for rule in TASK_CAPABILITY_RULES
+            if rule_applies(rule, matched) and platform["name"] in rule.get("platforms", (platform["name"],))
+            for task in rule["tasks"]
+        ],
+    }
+
+
+# Section kinds recognised in PRD headings, checked in order; anything else is "other"
+PRD_SECTION_KINDS = (
+    ("features", ("feature",)),
+    ("tools", ("tool", "technolog", "tech stack")),
+    ("architecture", ("architecture",)),
+    ("milestones", ("milestone", "timeline", "roadmap")),
+    ("overview", ("overview", "summary", "introduction")),
+)
+PRD_TITLE_PREFIX = "product requirements document:"
+
+
+def prd_section_kind(heading):
+    heading = heading.lower()
+    for kind, keywords in PRD_SECTION_KINDS:
+        if any(keyword in heading for keyword in keywords):
+            return kind
+    return "other"
+
+
+@st.cache_data(max_entries=32, show_spinner=False)
+def parse_prd(prd_text):
+    """Parse a markdown PRD into ``{"title", "project_name", "sections"}`` in one pass.
+
+    Each section is ``{"kind", "heading", "level", "text", "items", "children"}``:
+    ``items`` are its own bullet or numbered lines, ``text`` its other body
+    lines, and deeper headings nest under it as ``children``. Cached on the
+    text's content, so reruns with an unchanged PRD skip parsing.
+    """
+    prd = {"title": "", "project_name": "", "sections": []}
+    stack = []
+    for raw in prd_text.splitlines():
+        line = raw.strip()
+        level = len(line) - len(line.lstrip("#"))
+        if level and line[level:level + 1] in (" ", ""):
+            heading = line[level:].strip()
+            if level == 1 and not prd["title"]:
+                prd["title"] = heading
+                if heading.lower().startswith(PRD_TITLE_PREFIX):
+                    heading = heading[len(PRD_TITLE_PREFIX):].strip()
+                prd["project_name"] = heading
+                continue
+            section = {
+                "kind": prd_section_kind(heading),
+                "heading": heading,
+                "level": level,
+                "text": "",
+                "items": [],
+                "children": [],
+            }
+            while stack and stack[-1]["level"] >= level:
+                stack.pop()
+            (stack[-1]["children"] if stack else prd["sections"]).append(section)
+            stack.append(section)
+        elif stack and line:
+            marker, _, rest = line.partition(" ")
+            if marker in ("-", "*", "+") or (marker[:-1].isdigit() and marker[-1:] in (".", ")")):
+                stack[-1]["items"].append(rest.strip())
+            else:
+                stack[-1]["text"] += line + "\n"
+    return prd
+
+
+def prd_sections(prd, kind):
+    """Every section of ``kind`` in the parsed PRD, outermost first."""
+    pending = list(reversed(prd["sections"]))
+    while pending:
+        section = pending.pop()
+        if section["kind"] == kind:
+            yield section
+        pending.extend(reversed(section["children"]))
+
+
+def prd_items(prd, kind):
+    """Bullet items of the ``kind`` sections, including untyped subsections nested in them."""
+    items = []
+
+    def collect(section, inside):
+        inside = section["kind"] == kind or (inside and section["kind"] == "other")
+        if inside:
+            items.extend(section["items"])
+        for child in section["children"]:
+            collect(child, inside)
+
+    for section in prd["sections"]:
+        collect(section, False)
+    return items
 
 
 def generate_prd(project_name, project_description):
     with st.spinner("🤖 Generating comprehensive PRD document..."):
-        # Generate multiple sections using the model
-        # Overview section
-        overview_prompt = f"Product Requirements Document for {project_name}. Overview: {project_description}"
-        overview_text = generate_from_model(overview_prompt)
+        # Generate the overview, features and tools sections together in one batched pass
+        overview_text, features_text, tools_text = render_generation_stream(
+            stream_batch_from_model(
+                prd_section_prompts(project_name),
+                prefix=prd_context(project_name, project_description),
+                max_items=PRD_SECTION_ITEMS,
+            ),
+            ["Overview", "Features", "Tools"],
+            stop_key="stop_prd_generation",
+        )
         st.session_state["project_name"] = project_name
         st.session_state["project_description"] = project_description
         
-        # Features section - extract from description
-        features_prompt = f"Key features and functionalities for {project_name}: {project_description}"
-        features_text = generate_from_model(features_prompt)
-        
-        # Tools and technologies section
-        tools_prompt = f"Technologies, tools, and frameworks needed for {project_name}: {project_description}"
-        tools_text = generate_from_model(tools_prompt)
-        
         # Parse generated content
         def extract_bullet_points(text, max_items=8):
             """Extract meaningful bullet points from generated text"""
@@ -1179,7 +3158,6 @@ def generate_prd(project_name, project_description):
         
         # Extract features from description and generated text
         features_list = []
-        desc_lower = project_description.lower()
         
         # Extract explicit features mentioned in description
         desc_sentences = project_description.split('.')
@@ -1190,168 +3168,28 @@ def generate_prd(project_name, project_description):
                     features_list.append(sent)
         
         # Add generated features
+        explicit_count = len(features_list)
         if features_text:
             gen_features = extract_bullet_points(features_text, max_items=6)
             features_list.extend(gen_features)
         
-        # Remove duplicates and limit
-        seen = set()
-        unique_features = []
-        for feat in features_list:
-            feat_lower = feat.lower()[:50]  # Use first 50 chars for comparison
-            if feat_lower not in seen:
-                seen.add(feat_lower)
-                unique_features.append(feat)
-        features_list = unique_features[:10]
+        # Collapse generated paraphrases into the features stated in the description, and limit
+        priorities = [1] * explicit_count + [0] * (len(features_list) - explicit_count)
+        features_list = [features_list[i] for i in dedup_texts(features_list, priorities)][:10]
         
-        # If still no features, create intelligent defaults based on keywords
+        # If still no features, fall back to the defaults for the detected project type
+        profile = detect_project_profile(project_description, project_name)
         if not features_list:
-            if 'chatbot' in desc_lower or 'ai' in desc_lower:
-                features_list = [
-                    "Natural language processing and understanding capabilities",
-                    "Conversational user interface with context awareness",
-                    "Integration with knowledge base and FAQ system",
-                    "Multi-channel support (web, mobile, API)"
-                ]
-            elif 'e-commerce' in desc_lower or 'shopping' in desc_lower:
-                features_list = [
-                    "Product catalog with search and filtering",
-                    "Shopping cart and checkout system",
-                    "Secure payment gateway integration",
-                    "Order management and tracking system"
-                ]
-            elif 'ios' in desc_lower or 'iphone' in desc_lower or 'ipad' in desc_lower:
-                features_list = [
-                    "Native iOS application with Swift/SwiftUI",
-                    "iOS Human Interface Guidelines compliance",
-                    "App Store integration and submission",
-                    "Core Data or CloudKit for data persistence",
-                    "Push notifications via APNs"
-                ]
-            elif 'android' in desc_lower and ('ios' not in desc_lower and 'iphone' not in desc_lower):
-                features_list = [
-                    "Native Android application with Kotlin/Java",
-                    "Material Design guidelines compliance",
-                    "Google Play Store integration",
-                    "Room or SQLite for local database",
-                    "Firebase Cloud Messaging for push notifications"
-                ]
-            elif 'mobile' in desc_lower or 'app' in desc_lower:
-                # Check if it's cross-platform or native
-                if 'native' in desc_lower or 'swift' in desc_lower or 'kotlin' in desc_lower:
-                    # Native development
-                    if 'ios' in desc_lower or 'iphone' in desc_lower:
-                        features_list = [
-                            "Native iOS application with Swift/SwiftUI",
-                            "iOS Human Interface Guidelines compliance",
-                            "App Store integration",
-                            "Core Data for local storage"
-                        ]
-                    else:
-                        features_list = [
-                            "Native mobile application",
-                            "Platform-specific UI/UX",
-                            "App store integration",
-                            "Local data persistence"
-                        ]
-                else:
-                    # Cross-platform
-                    features_list = [
-                        "Cross-platform mobile application (iOS/Android)",
-                        "Offline functionality and data synchronization",
-                        "Push notifications for updates and reminders",
-                        "User authentication and profile management"
-                    ]
-            else:
-                features_list = [
-                    "User-friendly and intuitive interface",
-                    "Core functionality as per requirements",
-                    "Data management and storage system",
-                    "Security and authentication mechanisms"
-                ]
+            features_list = list(profile["features"])
         
         # Extract tools and technologies
         tools_list = []
         if tools_text:
             tools_list = extract_bullet_points(tools_text, max_items=8)
         
-        # Intelligent tool detection based on project type - CHECK iOS/Android FIRST
+        # Default tools for the detected project type
         if not tools_list:
-            # iOS Native Development
-            if 'ios' in desc_lower or 'iphone' in desc_lower or 'ipad' in desc_lower or ('native' in desc_lower and 'ios' in project_name.lower()):
-                tools_list = [
-                    "Xcode - Apple's integrated development environment (IDE)",
-                    "Swift programming language for iOS development",
-                    "SwiftUI or UIKit for user interface development",
-                    "Core Data or CloudKit for data persistence",
-                    "CocoaPods or Swift Package Manager for dependency management",
-                    "TestFlight for beta testing",
-                    "App Store Connect for app distribution"
-                ]
-            # Android Native Development
-            elif 'android' in desc_lower and ('ios' not in desc_lower and 'iphone' not in desc_lower) or ('native' in desc_lower and 'android' in project_name.lower()):
-                tools_list = [
-                    "Android Studio - Official Android IDE",
-                    "Kotlin or Java programming language",
-                    "Jetpack Compose or XML layouts for UI",
-                    "Room or SQLite for local database",
-                    "Gradle for build automation and dependency management",
-                    "Google Play Console for app distribution",
-                    "Firebase for backend services (optional)"
-                ]
-            # Cross-platform Mobile (React Native/Flutter)
-            elif ('react native' in desc_lower or 'flutter' in desc_lower or 'cross-platform' in desc_lower) and ('native' not in desc_lower):
-                tools_list = [
-                    "React Native or Flutter for cross-platform development",
-                    "Firebase or AWS for backend services",
-                    "SQLite or Realm for local database",
-                    "RESTful API for server communication"
-                ]
-            # Generic Mobile App (assume cross-platform if not specified)
-            elif 'mobile' in desc_lower or 'app' in desc_lower:
-                # Check for native keywords
-                if 'native' in desc_lower or 'swift' in desc_lower or 'xcode' in desc_lower:
-                    tools_list = [
-                        "Xcode and Swift for iOS development",
-                        "SwiftUI or UIKit framework",
-                        "Core Data for local storage",
-                        "App Store Connect for distribution"
-                    ]
-                elif 'kotlin' in desc_lower or 'android studio' in desc_lower:
-                    tools_list = [
-                        "Android Studio and Kotlin for Android development",
-                        "Jetpack Compose or XML layouts",
-                        "Room database for local storage",
-                        "Google Play Console for distribution"
-                    ]
-                else:
-                    tools_list = [
-                        "React Native or Flutter for cross-platform development",
-                        "Firebase or AWS for backend services",
-                        "SQLite or Realm for local database",
-                        "RESTful API for server communication"
-                    ]
-            elif 'web' in desc_lower or 'website' in desc_lower:
-                tools_list = [
-                    "React.js or Vue.js for frontend framework",
-                    "Node.js or Python Django/Flask for backend",
-                    "PostgreSQL or MongoDB for database",
-                    "Docker for containerization and deployment"
-                ]
-            elif 'ai' in desc_lower or 'chatbot' in desc_lower:
-                tools_list = [
-                    "Python with TensorFlow or PyTorch for ML models",
-                    "NLTK or spaCy for NLP processing",
-                    "FastAPI or Flask for API development",
-                    "Vector database (Pinecone/Weaviate) for embeddings"
-                ]
-            else:
-                tools_list = [
-                    "Modern web framework (React/Vue/Angular)",
-                    "Backend API framework (Node.js/Python/Java)",
-                    "Database system (PostgreSQL/MySQL/MongoDB)",
-                    "Cloud hosting platform (AWS/Azure/GCP)"
-                ]
+            tools_list = list(profile["tools"])
         
         # Build comprehensive PRD
         full_prd = f"""# Product Requirements Document: {project_name}
@@ -1394,162 +3232,76 @@ def generate_prd(project_name, project_description):
 def generate_tasks_from_prd(prd_input):
     with st.spinner("🤖 Generating comprehensive task list from PRD..."):
         # Generate tasks using model based on PRD content
-        task_prompt = f"Generate a detailed task list for this project PRD:\n\n{prd_input[:1000]}\n\nTasks:"
-        tasks_text = generate_from_model(task_prompt)
+        task_context = f"Generate a detailed task list for this project PRD:\n\n{prd_input[:1000]}\n\n"
+        (tasks_text,) = render_generation_stream(
+            stream_batch_from_model(
+                ["Tasks as JSON (title, phase, required skills):"],
+                prefix=task_context,
+                max_items=TASK_LIST_ITEMS,
+                unit="json",
+            ),
+            ["Tasks"],
+            stop_key="stop_task_generation",
+        )
         
+        # Model tasks are grouped by phase and slotted in with the planned tasks of that phase
         tasks = []
-        prd_lower = prd_input.lower()
-        project_name_lower = prd_lower.split('product requirements document:')[1].split('\n')[0].strip().lower() if 'product requirements document:' in prd_lower else ""
+        generated = set()
+        generated_by_phase = {phase: [] for phase in TASK_PHASES}
+        for task in parse_task_json(tasks_text or ""):
+            skills = f" (skills: {', '.join(task['skills'])})" if task["skills"] else ""
+            generated_by_phase[task["phase"]].append(f"{task['title']}{skills}")
+
+        def add_generated(phase):
+            generated.update(range(len(tasks), len(tasks) + len(generated_by_phase[phase])))
+            tasks.extend(generated_by_phase[phase])
         
-        # Detect platform type
-        is_ios = 'ios' in prd_lower or 'iphone' in prd_lower or 'ipad' in prd_lower or 'xcode' in prd_lower or 'swift' in prd_lower or 'ios' in project_name_lower
-        is_android = ('android' in prd_lower or 'kotlin' in prd_lower or 'android studio' in prd_lower) and not is_ios
-        is_native_mobile = is_ios or is_android
-        is_cross_platform = ('react native' in prd_lower or 'flutter' in prd_lower or 'cross-platform' in prd_lower) and not is_native_mobile
+        # Detect platform type and capabilities in one scan of the PRD
+        prd = parse_prd(prd_input)
+        profile = detect_project_profile(prd_input, prd["project_name"])
         
         # Phase 1: Planning and Setup
         tasks.append("Review and analyze PRD requirements thoroughly")
         tasks.append("Create detailed technical design document")
         
         # Platform-specific setup tasks
-        if is_ios:
-            tasks.append("Install and configure Xcode development environment")
-            tasks.append("Set up Apple Developer account and certificates")
-            tasks.append("Create new Xcode project with Swift/SwiftUI")
-            tasks.append("Configure project settings (bundle ID, version, etc.)")
-        elif is_android:
-            tasks.append("Install and configure Android Studio")
-            tasks.append("Set up Android SDK and required tools")
-            tasks.append("Create new Android project with Kotlin/Java")
-            tasks.append("Configure app manifest and build.gradle")
-        elif is_cross_platform:
-            tasks.append("Set up React Native or Flutter development environment")
-            tasks.append("Initialize cross-platform project structure")
-            tasks.append("Configure platform-specific settings")
-        else:
-            tasks.append("Set up development environment and tools")
+        tasks.extend(profile["setup_tasks"])
         
         tasks.append("Initialize project repository and version control")
+        add_generated("planning")
         
-        # Extract features from PRD and create tasks
-        lines = prd_input.split('\n')
-        feature_section = False
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
-            if 'feature' in line_lower and ('##' in line or '###' in line):
-                feature_section = True
-                continue
-            if feature_section and ('##' in line or '###' in line) and 'feature' not in line_lower:
-                feature_section = False
-            if feature_section and '- ' in line:
-                feature = line.split('- ', 1)[1].strip()
-                if len(feature) > 5 and len(feature) < 150:
-                    tasks.append(f"Implement feature: {feature}")
+        # Create tasks from the PRD's feature sections
+        for feature in prd_items(prd, "features"):
+            if len(feature) > 5 and len(feature) < 150:
+                tasks.append(f"Implement feature: {feature}")
         
-        # Extract tools and create setup tasks
-        tools_section = False
-        for i, line in enumerate(lines):
-            line_lower = line.lower()
-            if 'tool' in line_lower or 'technolog' in line_lower:
-                tools_section = True
-                continue
-            if tools_section and ('##' in line or '###' in line):
-                tools_section = False
-            if tools_section and '- ' in line:
-                tool = line.split('- ', 1)[1].strip()
-                if len(tool) > 5:
-                    # Skip generic setup if it's iOS/Android specific
-                    if is_ios and 'xcode' in tool.lower():
-                        continue  # Already added above
-                    if is_android and 'android studio' in tool.lower():
-                        continue  # Already added above
-                    tasks.append(f"Set up and configure {tool}")
+        # Create setup tasks from the tools sections
+        for tool in prd_items(prd, "tools"):
+            if len(tool) > 5:
+                # Skip tools whose setup the platform tasks above already cover
+                if any(covered in tool.lower() for covered in profile["skip_tools"]):
+                    continue
+                tasks.append(f"Set up and configure {tool}")
+        add_generated("setup")
         
-        # Platform-specific development tasks
-        if is_ios:
-            tasks.append("Design iOS UI/UX following Human Interface Guidelines")
-            tasks.append("Implement SwiftUI views or UIKit components")
-            tasks.append("Set up Core Data or CloudKit for data persistence")
-            tasks.append("Configure App Store Connect and app metadata")
-            tasks.append("Implement push notifications using APNs")
-            tasks.append("Add app icons and launch screens for all device sizes")
-        elif is_android:
-            tasks.append("Design Android UI/UX following Material Design guidelines")
-            tasks.append("Implement Jetpack Compose or XML layouts")
-            tasks.append("Set up Room database or SQLite for local storage")
-            tasks.append("Configure Google Play Console and app listing")
-            tasks.append("Implement Firebase Cloud Messaging for push notifications")
-            tasks.append("Add app icons and adaptive icons for different densities")
-        else:
-            # Core development tasks based on PRD content (web/cross-platform)
-            if 'frontend' in prd_lower or 'ui' in prd_lower or 'interface' in prd_lower:
-                tasks.append("Design user interface mockups and wireframes")
-                tasks.append("Implement responsive frontend components")
-                tasks.append("Integrate frontend with backend APIs")
-        
-        if 'backend' in prd_lower or 'api' in prd_lower:
-            tasks.append("Design and develop RESTful API endpoints")
-            tasks.append("Implement API authentication and authorization")
-            tasks.append("Create API documentation")
-        
-        if 'database' in prd_lower or 'data' in prd_lower:
-            tasks.append("Design database schema and relationships")
-            tasks.append("Implement database migrations")
-            tasks.append("Set up database indexing and optimization")
-        
-        if 'authentication' in prd_lower or 'security' in prd_lower:
-            tasks.append("Implement user authentication system")
-            tasks.append("Add security measures and data encryption")
-            tasks.append("Set up role-based access control")
-        
-        # Parse generated tasks from model
-        if tasks_text:
-            gen_lines = tasks_text.split('\n')
-            for line in gen_lines:
-                line = line.strip()
-                if line:
-                    # Remove numbering
-                    for prefix in ['1.', '2.', '3.', '4.', '5.', '-', '*']:
-                        if line.startswith(prefix):
-                            line = line[len(prefix):].strip()
-                            break
-                    if len(line) > 10 and len(line) < 200:
-                        # Avoid duplicates
-                        if not any(line.lower() in existing.lower() or existing.lower() in line.lower() for existing in tasks):
-                            tasks.append(line)
+        # Platform-specific development tasks, then frontend/backend/database/security work the PRD calls for
+        tasks.extend(profile["development_tasks"])
+        tasks.extend(profile["capability_tasks"])
+        add_generated("development")
         
         # Testing and deployment phase - platform specific
         tasks.append("Write comprehensive unit tests")
         tasks.append("Implement integration tests")
+        add_generated("testing")
         
-        if is_ios:
-            tasks.append("Test on iOS Simulator and physical devices")
-            tasks.append("Configure TestFlight for beta testing")
-            tasks.append("Submit app for App Store review")
-            tasks.append("Set up App Store analytics and crash reporting")
-        elif is_android:
-            tasks.append("Test on Android emulator and physical devices")
-            tasks.append("Set up internal testing track in Google Play Console")
-            tasks.append("Submit app for Google Play Store review")
-            tasks.append("Configure Google Play Console analytics")
-        else:
-            tasks.append("Perform code review and refactoring")
-            tasks.append("Set up CI/CD pipeline")
-            tasks.append("Deploy to staging environment")
-            tasks.append("Perform user acceptance testing (UAT)")
-            tasks.append("Deploy to production environment")
-            tasks.append("Set up monitoring and logging")
+        tasks.extend(profile["release_tasks"])
+        add_generated("release")
         
         tasks.append("Create user documentation and guides")
         
-        # Remove duplicates while preserving order
-        seen = set()
-        unique_tasks = []
-        for task in tasks:
-            task_lower = task.lower()[:60]  # Use first 60 chars for comparison
-            if task_lower not in seen:
-                seen.add(task_lower)
-                unique_tasks.append(task)
+        # Collapse model-generated near-duplicates into the planned tasks and each other, preserving order
+        priorities = [0 if i in generated else 1 for i in range(len(tasks))]
+        unique_tasks = [tasks[i] for i in dedup_texts(tasks, priorities)]
         
         # Limit to reasonable number but keep important ones
         if len(unique_tasks) > 25:
@@ -1569,15 +3321,33 @@ def format_assignments_summary(assignments_df):
         lines.append(f"- {task} -> {assignee} (Skills: {skills})")
     return "\n".join(lines)
 
+def prd_excerpt_text(prd, prd_text, limit=400):
+    """Overview text plus key features of a parsed PRD; the raw opening for unstructured text."""
+    overview = " ".join(section["text"].replace("\n", " ").strip() for section in prd_sections(prd, "overview"))
+    features = prd_items(prd, "features")
+    if not overview and not features:
+        return prd_text[:limit]
+    excerpt = overview.strip()
+    if features:
+        excerpt += f"\nKey features: {'; '.join(features)}"
+    return excerpt.strip()[:limit]
+
+
 def generate_email_report(assignments_df, from_email, to_email, signature, project_name, prd_text, tasks_list):
     """Use the local text generator to craft a concise status email, anchored on real assignment data."""
     summary = format_assignments_summary(assignments_df)
     task_lines = "\n".join(f"- {t}" for t in tasks_list[:12]) if tasks_list else ""
-    prd_excerpt = (prd_text or "")[:400]
+    prd = parse_prd(prd_text or "")
+    project_name = project_name or prd["project_name"] or "Project"
+    prd_excerpt = prd_excerpt_text(prd, prd_text or "")
 
-    prompt = (
+    # Instructions and PRD excerpt are the same for every email on a project, so they form the cached prefix
+    context = (
         "Write a short, professional status email. Keep it concise and client-ready.\n"
         f"Project name: {project_name}\n"
+        f"PRD excerpt:\n{prd_excerpt}\n"
+    )
+    prompt = (
         f"From: {from_email}\n"
         f"To: {to_email}\n"
         "Structure:\n"
@@ -1589,11 +3359,12 @@ def generate_email_report(assignments_df, from_email, to_email, signature, proje
         "Assignments list (use these bullets verbatim, do not add new items):\n"
         f"{summary}\n"
         f"Tasks (raw list, optional to mention count):\n{task_lines}\n"
-        f"PRD excerpt:\n{prd_excerpt}\n"
         "Return only the email body, no subject line."
     )
 
-    generated = generate_from_model(prompt) or ""
+    (generated,) = render_generation_stream(
+        stream_batch_from_model([prompt], prefix=context), ["Email draft"], stop_key="stop_email_generation"
+    )
 
     # If the model output lacks our required bullets, fall back to a deterministic version
     if summary not in generated:
@@ -1607,39 +3378,829 @@ def generate_email_report(assignments_df, from_email, to_email, signature, proje
 
     return generated.strip()
 
-def assign_tasks(tasks, employees_df):
+def employee_csv_hash(uploaded_file):
+    """Content hash of an uploaded CSV, computed without copying its bytes."""
+    with uploaded_file.getbuffer() as view:
+        return hashlib.blake2b(view, digest_size=16).hexdigest()
+
+
+@st.cache_data(max_entries=8, show_spinner="Reading employee CSV...")
+def parse_employee_csv(content_hash, _source):
+    """Stream the CSV in chunks, keeping only EMPLOYEE_COLUMNS with pinned dtypes.
+
+    Cached by ``content_hash`` so re-uploading the same roster skips parsing.
+    Rows without a name or skills are dropped; returns ``(frame, dropped_rows)``.
+    """
+    _source.seek(0)
+    header = pd.read_csv(_source, nrows=0).columns
+    missing = [col for col in REQUIRED_EMPLOYEE_COLUMNS if col not in header]
+    if missing:
+        raise ValueError(f"missing required column(s): {', '.join(missing)}")
+    columns = [col for col in header if col in EMPLOYEE_COLUMNS]
+    # Numeric columns are validated per chunk; categories are unified once at the end
+    read_dtypes = {col: "object" for col in columns}
+    numeric = [col for col in columns if EMPLOYEE_COLUMNS[col] == "Int64"]
+
+    _source.seek(0)
+    chunks, dropped = [], 0
+    reader = pd.read_csv(
+        _source, usecols=columns, dtype=read_dtypes, chunksize=EMPLOYEE_CSV_CHUNK_ROWS
+    )
+    for chunk in reader:
+        for col in REQUIRED_EMPLOYEE_COLUMNS:
+            chunk[col] = chunk[col].str.strip()
+        valid = chunk["name"].fillna("").ne("") & chunk["skills"].fillna("").ne("")
+        dropped += int((~valid).sum())
+        chunk = chunk[valid]
+        for col in numeric:
+            chunk[col] = pd.to_numeric(chunk[col], errors="coerce").round().astype("Int64")
+        chunks.append(chunk)
+
+    employees_df = pd.concat(chunks, ignore_index=True) if chunks else pd.DataFrame(columns=columns)
+    for col in columns:
+        if EMPLOYEE_COLUMNS[col] == "category":
+            employees_df[col] = employees_df[col].astype("category")
+    return employees_df, dropped
+
+
+def encode_texts(texts, model_name=EMBEDDING_MODEL_NAME, batch_size=EMBEDDING_BATCH_SIZE, cached=False):
+    """Encode texts in batched calls into L2-normalized float32 rows.
+
+    With ``cached=True`` rows are read back from the persistent embedding store
+    and only texts it has not seen are sent to the model.
+    """
+    texts = [str(text) for text in texts]
+    if cached and texts:
+        store = get_embedding_store(model_name)
+        keys = [store.key(model_name, text) for text in texts]
+        embeddings, missing = store.get_many(keys)
+        if missing:
+            pending = {}
+            for pos in missing:
+                pending.setdefault(keys[pos], texts[pos])
+            fresh = encode_texts(list(pending.values()), model_name, batch_size)
+            # Round-trip through float16 so cold and warm runs score identically
+            fresh = fresh.astype(np.float16).astype(np.float32)
+            store.put_many(list(pending), fresh)
+            by_key = dict(zip(pending, fresh))
+            if embeddings.shape[1] == 0:
+                # Store was empty, so every row is a miss
+                embeddings = np.zeros((len(texts), fresh.shape[1]), dtype=np.float32)
+            for pos in missing:
+                embeddings[pos] = by_key[keys[pos]]
+        return embeddings
+
+    model = get_embedding_model(model_name)
+    if not texts:
+        return np.zeros((0, model.get_sentence_embedding_dimension()), dtype=np.float32)
+    embeddings = model.encode(
+        texts,
+        batch_size=batch_size,
+        convert_to_numpy=True,
+        normalize_embeddings=True,
+        show_progress_bar=False,
+    )
+    return np.asarray(embeddings, dtype=np.float32)
+
+
+def similarity_matrix(task_embeddings, employee_embeddings):
+    """Cosine similarity of every task against every employee (rows must be normalized)."""
+    return task_embeddings @ employee_embeddings.T
+
+
+def top_k(scores, k, columns=None):
+    """Column indices and values of the k largest entries per row, best first.
+
+    Rows are processed TOP_K_BLOCK_ROWS at a time, so apart from the (n, k)
+    result only one block is ever copied. With ``columns`` only those columns
+    are considered, and the returned indices are positions within ``columns``.
+    """
+    n_cols = scores.shape[1] if columns is None else len(columns)
+    k = min(k, n_cols)
+    idx = np.empty((scores.shape[0], k), dtype=np.intp)
+    values = np.empty((scores.shape[0], k), dtype=scores.dtype)
+    for start in range(0, scores.shape[0], TOP_K_BLOCK_ROWS):
+        block = scores[start:start + TOP_K_BLOCK_ROWS]
+        if columns is not None:
+            block = block[:, columns]
+        if k < n_cols:
+            part = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        else:
+            part = np.broadcast_to(np.arange(k), (len(block), k))
+        part_values = np.take_along_axis(block, part, axis=1)
+        order = np.argsort(-part_values, axis=1, kind="stable")
+        idx[start:start + len(block)] = np.take_along_axis(part, order, axis=1)
+        values[start:start + len(block)] = np.take_along_axis(part_values, order, axis=1)
+    return idx, values
+
+
+def near_duplicate_neighbours(embeddings, threshold=DEDUP_SIMILARITY):
+    """Per row, the rows (itself included) whose cosine similarity reaches ``threshold``.
+
+    Short lists compare every pair in one matmul. From DEDUP_LSH_MIN_ITEMS rows
+    on, only rows sharing a bucket in one of DEDUP_LSH_TABLES random-hyperplane
+    tables are compared, so near-duplicates are found with high probability
+    without the quadratic matrix.
+    """
+    n = len(embeddings)
+    if n < DEDUP_LSH_MIN_ITEMS:
+        return [np.flatnonzero(row >= threshold) for row in embeddings @ embeddings.T]
+    neighbours = [{i} for i in range(n)]
+    rng = np.random.default_rng(0)
+    weights = 1 << np.arange(DEDUP_LSH_BITS)
+    for _ in range(DEDUP_LSH_TABLES):
+        planes = rng.standard_normal((embeddings.shape[1], DEDUP_LSH_BITS)).astype(np.float32)
+        codes = ((embeddings @ planes) > 0) @ weights
+        order = np.argsort(codes, kind="stable")
+        starts = np.flatnonzero(np.diff(codes[order], prepend=-1))
+        for bucket in np.split(order, starts[1:]):
+            if len(bucket) < 2:
+                continue
+            block = embeddings[bucket] @ embeddings[bucket].T
+            for row, col in zip(*np.nonzero(block >= threshold)):
+                neighbours[bucket[row]].add(int(bucket[col]))
+    return [np.fromiter(group, dtype=np.intp) for group in neighbours]
+
+
+def dedup_texts(texts, priorities=None, threshold=DEDUP_SIMILARITY):
+    """Positions of the texts kept once near-duplicates are collapsed, in input order.
+
+    Every text is embedded in one batch through the embedding store, so the
+    assignment step reads the surviving rows back instead of encoding them
+    again. A near-duplicate is only dropped in favour of a higher-priority
+    text, or of an earlier one when both have priority 0: texts with a
+    positive priority (e.g. planned tasks) never remove each other unless
+    they are equal after case and whitespace folding. Without the embedding
+    model only such equal texts are collapsed.
+    """
+    texts = [str(text) for text in texts]
+    if not texts:
+        return []
+    priorities = np.zeros(len(texts)) if priorities is None else np.asarray(priorities, dtype=np.float64)
+    folded = [" ".join(text.lower().split()) for text in texts]
+    try:
+        neighbours = near_duplicate_neighbours(encode_texts(texts, cached=True), threshold)
+    except Exception as e:
+        st.warning(f"Semantic de-duplication unavailable, removing exact repeats only: {e}")
+        neighbours = [np.zeros(0, dtype=np.intp)] * len(texts)
+    repeats = {}
+    for pos, text in enumerate(folded):
+        repeats.setdefault(text, []).append(pos)
+    dropped = np.zeros(len(texts), dtype=bool)
+    kept = []
+    for pos in np.lexsort((np.arange(len(texts)), -priorities)).tolist():
+        if dropped[pos]:
+            continue
+        kept.append(pos)
+        similar = neighbours[pos]
+        # Rows are visited highest priority first, so no neighbour outranks ``pos``
+        dropped[similar[(priorities[similar] < priorities[pos]) | (priorities[similar] == 0)]] = True
+        dropped[repeats[folded[pos]]] = True
+    return sorted(kept)
+
+
+class IVFIndex:
+    """Inverted-file ANN index over L2-normalized embeddings.
+
+    A spherical k-means quantizer splits the vectors into ``nlist`` cells and a
+    query only scores the ``nprobe`` cells whose centroids are closest, so
+    recall and latency are traded off with ``nprobe`` alone. Vectors are keyed
+    by caller-supplied int64 ids, which makes roster edits incremental.
+    """
+
+    def __init__(self, centroids, nprobe=ANN_NPROBE):
+        self.centroids = np.asarray(centroids, dtype=np.float32)
+        self.nprobe = nprobe
+        dim = self.centroids.shape[1]
+        self._ids = [np.zeros(0, dtype=np.int64) for _ in range(len(self.centroids))]
+        self._vectors = [np.zeros((0, dim), dtype=np.float32) for _ in range(len(self.centroids))]
+        self._cell_of = {}
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    @classmethod
+    def build(cls, vectors, ids, nlist=None, nprobe=ANN_NPROBE, n_iter=10, seed=0):
+        """Train the quantizer on (a sample of) ``vectors`` and index all of them."""
+        vectors = np.asarray(vectors, dtype=np.float32)
+        n = len(vectors)
+        nlist = min(n, nlist or max(1, int(np.sqrt(n))))
+        rng = np.random.default_rng(seed)
+        sample = vectors[rng.choice(n, size=min(n, nlist * 64), replace=False)]
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)].copy()
+        for _ in range(n_iter):
+            assign = (sample @ centroids.T).argmax(axis=1)
+            order = np.argsort(assign, kind="stable")
+            cells, starts = np.unique(assign[order], return_index=True)
+            centroids[cells] = np.add.reduceat(sample[order], starts, axis=0)
+            empty = np.setdiff1d(np.arange(nlist), cells)
+            if len(empty):
+                centroids[empty] = sample[rng.choice(len(sample), size=len(empty), replace=False)]
+            centroids /= np.maximum(np.linalg.norm(centroids, axis=1, keepdims=True), 1e-12)
+        index = cls(centroids, nprobe=nprobe)
+        index.add(ids, vectors)
+        return index
+
+    def ids(self):
+        return np.concatenate(self._ids) if self._ids else np.zeros(0, dtype=np.int64)
+
+    def add(self, ids, vectors):
+        """Insert vectors under ``ids``; existing ids are replaced."""
+        ids, first = np.unique(np.asarray(ids, dtype=np.int64), return_index=True)
+        vectors = np.asarray(vectors, dtype=np.float32)[first]
+        if not len(ids):
+            return
+        self.remove([i for i in ids.tolist() if i in self._cell_of])
+        cells = (vectors @ self.centroids.T).argmax(axis=1)
+        order = np.argsort(cells, kind="stable")
+        unique_cells, starts = np.unique(cells[order], return_index=True)
+        for cell, group in zip(unique_cells, np.split(order, starts[1:])):
+            self._ids[cell] = np.concatenate([self._ids[cell], ids[group]])
+            self._vectors[cell] = np.concatenate([self._vectors[cell], vectors[group]])
+        self._cell_of.update(zip(ids.tolist(), cells.tolist()))
+
+    def remove(self, ids):
+        """Delete ``ids`` from the index; unknown ids are ignored."""
+        by_cell = {}
+        for i in ids:
+            cell = self._cell_of.pop(int(i), None)
+            if cell is not None:
+                by_cell.setdefault(cell, []).append(int(i))
+        for cell, cell_ids in by_cell.items():
+            keep = ~np.isin(self._ids[cell], cell_ids)
+            self._ids[cell] = self._ids[cell][keep]
+            self._vectors[cell] = self._vectors[cell][keep]
+
+    def search(self, queries, k=10):
+        """Return (scores, ids) of the approximate top-k per query; missing slots get id -1."""
+        queries = np.atleast_2d(np.asarray(queries, dtype=np.float32))
+        nprobe = min(self.nprobe, len(self.centroids))
+        probe, _ = top_k(queries @ self.centroids.T, nprobe)
+        cand_scores = np.full((len(queries), nprobe, k), -np.inf, dtype=np.float32)
+        cand_ids = np.full((len(queries), nprobe, k), -1, dtype=np.int64)
+        # Group (query, probe slot) pairs by cell so each cell is scored with one matmul
+        flat = probe.ravel()
+        order = np.argsort(flat, kind="stable")
+        cells, starts = np.unique(flat[order], return_index=True)
+        for cell, pairs in zip(cells, np.split(order, starts[1:])):
+            if not len(self._ids[cell]):
+                continue
+            rows, slots = np.divmod(pairs, nprobe)
+            idx, values = top_k(queries[rows] @ self._vectors[cell].T, k)
+            cand_scores[rows, slots, : idx.shape[1]] = values
+            cand_ids[rows, slots, : idx.shape[1]] = self._ids[cell][idx]
+        cand_scores = cand_scores.reshape(len(queries), -1)
+        idx, scores = top_k(cand_scores, k)
+        return scores, np.take_along_axis(cand_ids.reshape(len(queries), -1), idx, axis=1)
+
+    def save(self, path):
+        sizes = np.array([len(ids) for ids in self._ids], dtype=np.int64)
+        np.savez(
+            path,
+            centroids=self.centroids,
+            nprobe=np.int64(self.nprobe),
+            sizes=sizes,
+            ids=self.ids(),
+            vectors=np.concatenate(self._vectors).astype(np.float16),
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            index = cls(data["centroids"], nprobe=int(data["nprobe"]))
+            splits = np.cumsum(data["sizes"])[:-1]
+            index._ids = np.split(data["ids"], splits)
+            index._vectors = [v.astype(np.float32) for v in np.split(data["vectors"], splits)]
+        for cell, ids in enumerate(index._ids):
+            index._cell_of.update(dict.fromkeys(ids.tolist(), cell))
+        return index
+
+
+def candidate_field_texts(employees_df, weights=CANDIDATE_FIELD_WEIGHTS):
+    """Texts of the weighted candidate fields and each row's fusion weights.
+
+    Returns ``(fields, texts, row_weights)``. ``texts[field]`` holds one string
+    per row ("" when the value is missing) and ``row_weights`` (rows x fields)
+    zeroes missing values and renormalizes each row to sum to 1.
+    """
+    fields = [field for field, weight in weights.items() if weight > 0 and field in employees_df.columns]
+    if not fields:
+        fields, weights = ["skills"], {"skills": 1.0}
+    texts = {}
+    row_weights = np.zeros((len(employees_df), len(fields)), dtype=np.float32)
+    for j, field in enumerate(fields):
+        values = employees_df[field].astype(object)
+        present = values.notna().to_numpy() & values.astype(str).str.strip().ne("").to_numpy()
+        texts[field] = np.where(present, values.astype(str).to_numpy(), "").tolist()
+        row_weights[:, j] = np.where(present, weights[field], 0.0)
+    totals = row_weights.sum(axis=1, keepdims=True)
+    row_weights = np.divide(row_weights, totals, out=np.zeros_like(row_weights), where=totals > 0)
+    return fields, texts, row_weights
+
+
+def chunk_texts(texts, window=RESUME_CHUNK_TOKENS, overlap=RESUME_CHUNK_OVERLAP):
+    """Split texts into overlapping windows of embedding-model tokens.
+
+    Returns ``(chunks, offsets)``: the chunks of ``texts[i]`` are
+    ``chunks[offsets[i]:offsets[i + 1]]``; empty texts get no chunks.
+    """
+    if not texts:
+        # Fast tokenizers raise on an empty batch, e.g. when no resume changed since the last update
+        return [], np.zeros(1, dtype=np.intp)
+    model = get_embedding_model()
+    window = min(window, model.max_seq_length - 2)
+    overlap = min(overlap, window // 2)
+    step = window - overlap
+    encodings = model.tokenizer(list(texts), add_special_tokens=False, return_offsets_mapping=True)
+    chunks, offsets = [], [0]
+    for text, spans in zip(texts, encodings["offset_mapping"]):
+        for start in range(0, max(len(spans) - overlap, 1), step) if spans else ():
+            piece = spans[start : start + window]
+            chunks.append(text[piece[0][0] : piece[-1][1]])
+        offsets.append(len(chunks))
+    return chunks, np.asarray(offsets, dtype=np.intp)
+
+
+def encode_chunked_field(texts, batch_size=RESUME_BATCH_SIZE):
+    """Chunk and encode every text in large batches into a flat array plus offsets."""
+    chunks, offsets = chunk_texts(texts)
+    return encode_texts(chunks, batch_size=batch_size, cached=True), offsets
+
+
+def select_segments(offsets, rows):
+    """Flat indices covering the segments of ``rows``, and the offsets of that selection."""
+    rows = np.asarray(rows, dtype=np.intp)
+    starts = offsets[rows]
+    lengths = offsets[rows + 1] - starts
+    new_offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.intp)
+    idx = np.repeat(starts - new_offsets[:-1], lengths) + np.arange(new_offsets[-1])
+    return idx, new_offsets
+
+
+def segment_max(scores, offsets):
+    """Row-wise max over each column segment ``[offsets[i], offsets[i + 1])``; 0 for empty ones."""
+    out = np.zeros((scores.shape[0], len(offsets) - 1), dtype=np.float32)
+    nonempty = np.flatnonzero(np.diff(offsets) > 0)
+    if len(nonempty):
+        out[:, nonempty] = np.maximum.reduceat(scores, offsets[nonempty], axis=1)
+    return out
+
+
+def build_candidate_profile(fields, row_weights, field_embeddings, field_chunks):
+    """Combine per-field embeddings into the structure ``score_candidates`` consumes.
+
+    Single-vector fields are folded into one weighted sum: dot products with
+    it equal the weighted sum of per-field cosine similarities, so new weights
+    only need this cheap recombination. Chunked fields keep their flat chunk
+    array and offsets and are added at scoring time by max-sim pooling.
+    """
+    arrays = list(field_embeddings.values()) + [emb for emb, _ in field_chunks.values()]
+    fused = np.zeros((len(row_weights), arrays[0].shape[1]), dtype=np.float32)
+    chunked = []
+    for j, field in enumerate(fields):
+        if field in field_chunks:
+            chunked.append((row_weights[:, j],) + tuple(field_chunks[field]))
+        else:
+            fused += row_weights[:, j : j + 1] * field_embeddings[field]
+    return {"fused": fused, "chunked": chunked}
+
+
+def score_candidates(task_embeddings, profile, cols=None):
+    """Weighted similarity of tasks against candidate profiles (optionally a column subset)."""
+    fused = profile["fused"] if cols is None else profile["fused"][cols]
+    scores = similarity_matrix(task_embeddings, fused)
+    for weight, chunk_embeddings, offsets in profile["chunked"]:
+        if cols is not None:
+            idx, offsets = select_segments(offsets, cols)
+            chunk_embeddings, weight = chunk_embeddings[idx], weight[cols]
+        chunk_scores = similarity_matrix(task_embeddings, chunk_embeddings)
+        scores += weight * segment_max(chunk_scores, offsets)
+    return scores
+
+
+def candidate_profile(employees_df, weights=CANDIDATE_FIELD_WEIGHTS, batch_size=EMBEDDING_BATCH_SIZE):
+    """Profile of every employee, each field read through the embedding store."""
+    fields, texts, row_weights = candidate_field_texts(employees_df, weights)
+    field_embeddings, field_chunks = {}, {}
+    for field in fields:
+        if field in CHUNKED_FIELDS:
+            field_chunks[field] = encode_chunked_field(texts[field])
+        else:
+            field_embeddings[field] = encode_texts(texts[field], batch_size=batch_size, cached=True)
+    return build_candidate_profile(fields, row_weights, field_embeddings, field_chunks)
+
+
+def roster_row_ids(employees_df, weights=CANDIDATE_FIELD_WEIGHTS, model_name=EMBEDDING_MODEL_NAME):
+    """Stable int64 ids derived from each employee's name, matched fields and their weights."""
+    fields, texts, row_weights = candidate_field_texts(employees_df, weights)
+    columns = [employees_df["name"].astype(str).tolist()] + [texts[field] for field in fields]
+    keys = [
+        EmbeddingStore.key(model_name, "\n".join(values) + repr(row.round(6).tolist()))
+        for values, row in zip(zip(*columns), row_weights)
+    ]
+    return np.frombuffer(b"".join(key[:8] for key in keys), dtype="<i8").astype(np.int64)
+
+
+def get_roster_index(row_ids, embeddings):
+    """Return an ANN index over the current roster, reusing and patching earlier ones.
+
+    The index for an unchanged roster is taken from the session or from disk;
+    after an edit the previous index is patched with inserts/removals instead
+    of being retrained, unless the roster has changed too much.
+    """
+    roster_hash = hashlib.blake2b(np.sort(row_ids).tobytes(), digest_size=16).hexdigest()
+    index_dir = os.path.join(CACHE_DIR, "ann")
+    index_path = os.path.join(index_dir, f"{roster_hash}.npz")
+    cached = st.session_state.get("roster_index")
+    if cached and cached["hash"] == roster_hash:
+        return cached["index"]
+
+    if os.path.exists(index_path):
+        index = IVFIndex.load(index_path)
+    elif cached:
+        index = cached["index"]
+        current = index.ids()
+        added = ~np.isin(row_ids, current)
+        if added.sum() > ANN_REBUILD_FRACTION * max(len(index), 1):
+            index = IVFIndex.build(embeddings, row_ids)
+        else:
+            index.remove(np.setdiff1d(current, row_ids))
+            index.add(row_ids[added], embeddings[added])
+    else:
+        index = IVFIndex.build(embeddings, row_ids)
+
+    if not os.path.exists(index_path):
+        os.makedirs(index_dir, exist_ok=True)
+        index.save(index_path)
+        # Keep only the few most recent rosters on disk
+        saved = sorted(
+            (os.path.join(index_dir, name) for name in os.listdir(index_dir) if name.endswith(".npz")),
+            key=os.path.getmtime,
+        )
+        for stale in saved[:-ANN_MAX_SAVED_INDEXES]:
+            os.remove(stale)
+    st.session_state["roster_index"] = {"hash": roster_hash, "index": index}
+    return index
+
+
+def employee_capacities(employees_df, uniform_cap=1):
+    """Tasks each employee may take: the CSV ``capacity`` column, else ``uniform_cap``."""
+    caps = np.full(len(employees_df), uniform_cap, dtype=np.int64)
+    if "capacity" in employees_df.columns:
+        # Nullable Int64 would give an object array; ask for float64 with NaN for missing values
+        column = pd.to_numeric(employees_df["capacity"], errors="coerce").to_numpy(dtype="float64", na_value=np.nan)
+        caps = np.where(np.isnan(column), caps, column).astype(np.int64)
+    return np.maximum(caps, 0)
+
+
+def _greedy_capacitated_assignment(scores, capacities, candidates=32):
+    """Fill slots best-score-first from each task's top candidates."""
+    n_tasks = scores.shape[0]
+    remaining = capacities.copy()
+    assigned = np.full(n_tasks, -1, dtype=np.intp)
+    cand_idx, cand_scores = top_k(scores, candidates)
+    order = np.argsort(-cand_scores, axis=None, kind="stable")
+    rows, cols = np.unravel_index(order, cand_scores.shape)
+    for task, employee in zip(rows.tolist(), cand_idx[rows, cols].tolist()):
+        if assigned[task] < 0 and remaining[employee] > 0:
+            assigned[task] = employee
+            remaining[employee] -= 1
+    # Tasks whose candidates all filled up take the best employee with room left
+    for task in np.flatnonzero(assigned < 0):
+        open_scores = np.where(remaining > 0, scores[task], -np.inf)
+        best = int(open_scores.argmax())
+        if np.isfinite(open_scores[best]):
+            assigned[task] = best
+            remaining[best] -= 1
+    return assigned
+
+
+def solve_capacitated_assignment(scores, capacities, time_budget_s=SOLVER_TIME_BUDGET_S):
+    """Maximize total similarity with each employee taking at most ``capacities[j]`` tasks.
+
+    Returns ``(employee_idx, method)``; tasks left over when total capacity runs
+    out get index -1. Each task only needs its best employees up to a
+    cumulative capacity of n_tasks (any better assignment would have a free
+    slot among them), so the Hungarian solve runs over the union of those
+    columns, expanded into one column per capacity slot. The solve time and
+    matrix size are bounded from the problem shape before any pruning; if the
+    bound exceeds ``time_budget_s`` or SOLVER_MAX_CELLS a greedy assignment is
+    used instead.
+    """
+    scores = np.asarray(scores)
+    n_tasks = scores.shape[0]
+    capacities = np.minimum(np.asarray(capacities, dtype=np.int64), n_tasks)
+    if n_tasks == 0:
+        return np.zeros(0, dtype=np.intp), "optimal"
+
+    def predicted_s(n_slots):
+        return n_tasks * n_slots * min(n_tasks, n_slots) / SOLVER_OPS_PER_SECOND
+
+    usable = np.flatnonzero(capacities > 0)
+    usable_caps = capacities[usable]
+    if not len(usable):
+        return _greedy_capacitated_assignment(scores, capacities), "greedy"
+    # No prefix can be longer than n_tasks / smallest capacity
+    depth = min(len(usable), -(-n_tasks // int(usable_caps.min())))
+    # Most slots pruning can leave: every task's prefix may contribute distinct columns
+    max_slots = min(int(usable_caps.sum()), n_tasks * depth * int(usable_caps.max()))
+    if predicted_s(max_slots) > time_budget_s or n_tasks * max_slots > SOLVER_MAX_CELLS:
+        return _greedy_capacitated_assignment(scores, capacities), "greedy"
+
+    needed_columns = np.zeros(len(usable), dtype=bool)
+    subset = None if len(usable) == scores.shape[1] else usable
+    for start in range(0, n_tasks, TOP_K_BLOCK_ROWS):
+        ranked, _ = top_k(scores[start:start + TOP_K_BLOCK_ROWS], depth, columns=subset)
+        ranked_caps = usable_caps[ranked]
+        needed = (np.cumsum(ranked_caps, axis=1) - ranked_caps) < n_tasks
+        needed_columns[ranked[needed]] = True
+    columns = usable[needed_columns]
+    slots = np.repeat(columns, capacities[columns])
+
+    from scipy.optimize import linear_sum_assignment
+
+    task_rows, slot_cols = linear_sum_assignment(scores[:, slots].astype(np.float64), maximize=True)
+    assigned = np.full(n_tasks, -1, dtype=np.intp)
+    assigned[task_rows] = slots[slot_cols]
+    return assigned, "optimal"
+
+
+def build_assignments_df(tasks, employees_df, employee_idx, scores):
+    """Build the assignments table from index/score arrays instead of per-row lookups.
+
+    Tasks with index -1 (no capacity left) are reported as unassigned.
+    """
+    employee_idx = np.asarray(employee_idx, dtype=np.intp)
+    assigned = employee_idx >= 0
+    safe_idx = np.where(assigned, employee_idx, 0)
+    confidence = pd.Series(scores, dtype=float).map("{:.2%}".format).to_numpy()
+    return pd.DataFrame(
+        {
+            "Task": list(tasks),
+            "Assigned To": np.where(assigned, employees_df["name"].to_numpy()[safe_idx], "Unassigned"),
+            "Skills": np.where(assigned, employees_df["skills"].to_numpy()[safe_idx], ""),
+            "Confidence": np.where(assigned, confidence, ""),
+        }
+    )
+
+
+class AssignmentState:
+    """Embeddings and similarity from the last assignment, patched on edits.
+
+    Tasks are keyed by their text and each candidate field by its own text,
+    so an update only encodes added or edited entries. Employees are keyed by
+    their field texts plus fusion weights: unchanged similarity cells are
+    copied, and the best match is only recomputed for tasks whose previous
+    pick disappeared or that gained new candidates. New weights recombine
+    the cached field embeddings without re-encoding.
+    """
+
+    def __init__(self):
+        self.tasks = []
+        self.columns = []
+        self.task_embeddings = None
+        self.field_texts = {}
+        self.field_embeddings = {}
+        self.field_chunks = {}
+        self.scores = None
+        self.best_idx = None
+        self.best_scores = None
+        self.last_update = {}
+
+    @staticmethod
+    def _positions(old_keys, new_keys):
+        first = {}
+        for pos, key in enumerate(old_keys):
+            first.setdefault(key, pos)
+        return np.array([first.get(key, -1) for key in new_keys], dtype=np.intp)
+
+    @staticmethod
+    def _patch_rows(old_embeddings, src, texts, batch_size, cached=False):
+        missing = np.flatnonzero(src < 0)
+        fresh = encode_texts([texts[i] for i in missing], batch_size=batch_size, cached=cached)
+        dim = fresh.shape[1] if old_embeddings is None else old_embeddings.shape[1]
+        embeddings = np.empty((len(texts), dim), dtype=np.float32)
+        kept = src >= 0
+        if kept.any():
+            embeddings[kept] = old_embeddings[src[kept]]
+        embeddings[missing] = fresh
+        return embeddings
+
+    @staticmethod
+    def _patch_segments(old_chunks, src, texts):
+        missing = np.flatnonzero(src < 0)
+        fresh, fresh_offsets = encode_chunked_field([texts[i] for i in missing])
+        if old_chunks is None:
+            old_chunks = (np.zeros((0, fresh.shape[1]), dtype=np.float32), np.zeros(1, dtype=np.intp))
+        old_embeddings, old_offsets = old_chunks
+        kept = np.flatnonzero(src >= 0)
+        lengths = np.empty(len(texts), dtype=np.intp)
+        lengths[kept] = np.diff(old_offsets)[src[kept]]
+        lengths[missing] = np.diff(fresh_offsets)
+        offsets = np.concatenate([[0], np.cumsum(lengths)]).astype(np.intp)
+        embeddings = np.empty((offsets[-1], old_embeddings.shape[1]), dtype=np.float32)
+        embeddings[select_segments(offsets, kept)[0]] = old_embeddings[select_segments(old_offsets, src[kept])[0]]
+        embeddings[select_segments(offsets, missing)[0]] = fresh
+        return embeddings, offsets
+
+    def update(self, tasks, employees_df, weights=CANDIDATE_FIELD_WEIGHTS, batch_size=EMBEDDING_BATCH_SIZE):
+        """Bring the state in line with ``tasks``/``employees_df``; returns a similarity dict."""
+        tasks = [str(task) for task in tasks]
+        task_src = self._positions(self.tasks, tasks)
+        task_embeddings = self._patch_rows(self.task_embeddings, task_src, tasks, batch_size, cached=True)
+
+        fields, texts, row_weights = candidate_field_texts(employees_df, weights)
+        field_embeddings, field_chunks = {}, {}
+        reencoded = np.zeros(len(employees_df), dtype=bool)
+        for field in fields:
+            src = self._positions(self.field_texts.get(field, []), texts[field])
+            if field in CHUNKED_FIELDS:
+                field_chunks[field] = self._patch_segments(self.field_chunks.get(field), src, texts[field])
+            else:
+                field_embeddings[field] = self._patch_rows(
+                    self.field_embeddings.get(field), src, texts[field], batch_size, cached=True
+                )
+            reencoded |= src < 0
+        profile = build_candidate_profile(fields, row_weights, field_embeddings, field_chunks)
+        columns = list(zip(*(texts[field] for field in fields), map(tuple, row_weights.round(6).tolist())))
+        emp_src = self._positions(self.columns, columns)
+
+        new_rows, new_cols = task_src < 0, emp_src < 0
+        kept_rows, kept_cols = ~new_rows, ~new_cols
+        scores = np.empty((len(tasks), len(columns)), dtype=np.float32)
+        if kept_rows.any():
+            scores[np.ix_(kept_rows, kept_cols)] = self.scores[np.ix_(task_src[kept_rows], emp_src[kept_cols])]
+            scores[np.ix_(kept_rows, new_cols)] = score_candidates(
+                task_embeddings[kept_rows], profile, np.flatnonzero(new_cols)
+            )
+        scores[new_rows] = score_candidates(task_embeddings[new_rows], profile)
+
+        best_idx = np.zeros(len(tasks), dtype=np.intp)
+        best_scores = np.zeros(len(tasks), dtype=np.float32)
+        stale = new_rows.copy()
+        kept = np.flatnonzero(kept_rows)
+        if len(kept) and len(columns):
+            # Where did each kept task's previous best employee move to (-1 if gone)?
+            new_pos = {}
+            for pos, key in enumerate(columns):
+                new_pos.setdefault(key, pos)
+            old_best = self.best_idx[task_src[kept]]
+            moved = np.array([new_pos.get(self.columns[col], -1) for col in old_best.tolist()], dtype=np.intp)
+            stale[kept[moved < 0]] = True
+            ok = kept[moved >= 0]
+            best_idx[ok] = moved[moved >= 0]
+            best_scores[ok] = self.best_scores[task_src[ok]]
+            added = np.flatnonzero(new_cols)
+            if len(ok) and len(added):
+                challengers = scores[np.ix_(ok, added)]
+                pick = challengers.argmax(axis=1)
+                challenger_scores = challengers[np.arange(len(ok)), pick]
+                better = challenger_scores > best_scores[ok]
+                best_idx[ok[better]] = added[pick[better]]
+                best_scores[ok[better]] = challenger_scores[better]
+        stale_rows = np.flatnonzero(stale)
+        if len(stale_rows) and len(columns):
+            best_idx[stale_rows] = scores[stale_rows].argmax(axis=1)
+            best_scores[stale_rows] = scores[stale_rows, best_idx[stale_rows]]
+
+        self.last_update = {
+            "encoded_tasks": int(new_rows.sum()),
+            "encoded_employees": int(reencoded.sum()),
+            "rescored_tasks": int(len(stale_rows)),
+        }
+        self.tasks, self.columns = tasks, columns
+        self.task_embeddings = task_embeddings
+        self.field_texts, self.field_embeddings, self.field_chunks = texts, field_embeddings, field_chunks
+        self.scores, self.best_idx, self.best_scores = scores, best_idx, best_scores
+        return {"scores": scores, "best_idx": best_idx, "best_scores": best_scores}
+
+
+def score_tasks(
+    tasks,
+    employees_df,
+    batch_size=EMBEDDING_BATCH_SIZE,
+    exact=False,
+    state=None,
+    weights=CANDIDATE_FIELD_WEIGHTS,
+):
+    """Similarity of every task against the roster.
+
+    Returns ``{"scores": matrix}`` from the exact matmul, or, for rosters
+    routed through the ANN index, ``{"candidate_idx", "candidate_scores"}``
+    holding the TOP_K_MAX best rows per task. Employees are scored on their
+    ``weights``-fused candidate fields. With an ``AssignmentState`` the exact
+    path is patched incrementally from the previous run.
+    """
+    if state is not None and (exact or len(employees_df) < ANN_MIN_ROSTER):
+        return state.update(tasks, employees_df, weights, batch_size)
+    task_embeddings = encode_texts(tasks, batch_size=batch_size, cached=True)
+    profile = candidate_profile(employees_df, weights, batch_size)
+    if exact or len(employees_df) < ANN_MIN_ROSTER:
+        return {"scores": score_candidates(task_embeddings, profile)}
+
+    # The index covers the fused single-vector fields; chunked fields re-rank its candidates
+    row_ids = roster_row_ids(employees_df, weights)
+    index = get_roster_index(row_ids, profile["fused"])
+    depth = min(len(employees_df), TOP_K_MAX * (ANN_RERANK_FACTOR if profile["chunked"] else 1))
+    _, ids = index.search(task_embeddings, k=depth)
+    row_of = dict(zip(row_ids.tolist(), range(len(row_ids))))
+    rows = np.array([row_of.get(i, -1) for i in ids.ravel().tolist()], dtype=np.intp).reshape(ids.shape)
+    # Queries whose probed cells were all empty fall back to the exact scan
+    unresolved = np.flatnonzero(rows[:, 0] < 0)
+    if len(unresolved):
+        rows[unresolved], _ = top_k(score_candidates(task_embeddings[unresolved], profile), depth)
+    union, positions = np.unique(np.maximum(rows, 0), return_inverse=True)
+    union_scores = score_candidates(task_embeddings, profile, union)
+    scores = np.take_along_axis(union_scores, positions.reshape(rows.shape), axis=1)
+    scores[rows < 0] = -np.inf
+    best, scores = top_k(scores, TOP_K_MAX)
+    rows = np.take_along_axis(rows, best, axis=1)
+    return {"candidate_idx": rows, "candidate_scores": scores}
+
+
+def top_candidates(similarity, k):
+    """Row indices and scores of the k best employees per task, best first."""
+    if k == 1 and "best_idx" in similarity:
+        return similarity["best_idx"][:, None], similarity["best_scores"][:, None]
+    if "scores" in similarity:
+        return top_k(similarity["scores"], k)
+    return similarity["candidate_idx"][:, :k], similarity["candidate_scores"][:, :k]
+
+
+def match_tasks(tasks, employees_df, batch_size=EMBEDDING_BATCH_SIZE, capacities=None, similarity=None):
+    """Assign each task to its most similar employee in one batched, vectorized pass.
+
+    With ``capacities`` the assignment is solved globally so no employee gets
+    more tasks than their capacity. ``similarity`` reuses an earlier
+    ``score_tasks`` result. Returns ``(assignments_df, method)``.
+    """
+    if similarity is None:
+        similarity = score_tasks(tasks, employees_df, batch_size, exact=capacities is not None)
+    if capacities is not None:
+        scores = similarity["scores"]
+        best_idx, method = solve_capacitated_assignment(scores, capacities)
+        confidence = scores[np.arange(len(best_idx)), np.maximum(best_idx, 0)]
+        return build_assignments_df(tasks, employees_df, best_idx, confidence), method
+    best_idx, confidence = top_candidates(similarity, 1)
+    return build_assignments_df(tasks, employees_df, best_idx[:, 0], confidence[:, 0]), "best match"
+
+
+def build_suggestions_df(similarity, k):
+    """Long-format table of the k best candidates for every task in ``similarity``."""
+    employees_df = similarity["employees_df"]
+    idx, scores = top_candidates(similarity, k)
+    n_tasks, depth = idx.shape
+    # ANN candidate lists can come back short; those slots hold -1
+    found = idx.ravel() >= 0
+    flat_idx = idx.ravel()[found]
+    return pd.DataFrame(
+        {
+            "Task": np.repeat(np.asarray(similarity["tasks"], dtype=object), depth)[found],
+            "Rank": np.tile(np.arange(1, depth + 1), n_tasks)[found],
+            "Candidate": employees_df["name"].to_numpy()[flat_idx],
+            "Skills": employees_df["skills"].to_numpy()[flat_idx],
+            "Score": pd.Series(scores.ravel()[found], dtype=float).map("{:.2%}".format).to_numpy(),
+        }
+    )
+
+
+def assign_tasks(tasks, employees_df, uniform_cap=None, weights=None):
     with st.spinner("🤖 Matching tasks to employees based on skills..."):
-        assignments = []
         try:
-            model = SentenceTransformer("all-MiniLM-L6-v2")
-            employee_skills = employees_df["skills"].tolist()
-            skill_embeddings = model.encode(employee_skills, convert_to_tensor=True)
-
-            for task in tasks:
-                task_embedding = model.encode(task, convert_to_tensor=True)
-                cosine_scores = util.pytorch_cos_sim(task_embedding, skill_embeddings)
-                
-                # Convert tensor to CPU and then to numpy to avoid device error
-                cosine_scores_cpu = cosine_scores.cpu().detach().numpy()
-                best_employee_idx = np.argmax(cosine_scores_cpu)
-                confidence_score = float(cosine_scores_cpu[0][best_employee_idx])
-                
-                assignments.append(
-                    {
-                        "Task": task,
-                        "Assigned To": employees_df.iloc[best_employee_idx]["name"],
-                        "Skills": employees_df.iloc[best_employee_idx]["skills"],
-                        "Confidence": f"{confidence_score:.2%}",
-                    }
-                )
-            assignments_df = pd.DataFrame(assignments)
+            if employees_df.empty:
+                st.warning("⚠️ The employee CSV has no rows to assign tasks to.")
+                return
+            capacities = None
+            if uniform_cap is not None:
+                capacities = employee_capacities(employees_df, uniform_cap)
+            weights = weights or CANDIDATE_FIELD_WEIGHTS
+            state = st.session_state.setdefault("assignment_state", AssignmentState())
+            similarity = score_tasks(
+                tasks, employees_df, exact=capacities is not None, state=state, weights=weights
+            )
+            assignments_df, method = match_tasks(
+                tasks, employees_df, capacities=capacities, similarity=similarity
+            )
+            # Keep the scores so the top-k view can change k without re-encoding
+            similarity.update({"tasks": list(tasks), "employees_df": employees_df})
+            st.session_state["similarity"] = similarity
             st.session_state["assignments_df"] = assignments_df
-            st.success(f"✅ Successfully assigned {len(assignments)} tasks!")
+            st.session_state["assignment_cap"] = uniform_cap
+            st.session_state["assignment_weights"] = dict(weights)
+            unassigned = int((assignments_df["Assigned To"] == "Unassigned").sum()) if capacities is not None else 0
+            st.success(f"✅ Successfully assigned {len(assignments_df) - unassigned} tasks ({method})!")
+            if unassigned:
+                st.warning(f"⚠️ {unassigned} tasks could not be assigned: every employee is at capacity.")
+            if state.last_update and "best_idx" in similarity:
+                st.caption(
+                    f"Encoded {state.last_update['encoded_tasks']} new tasks and "
+                    f"{state.last_update['encoded_employees']} new employees; "
+                    f"re-scored {state.last_update['rescored_tasks']} tasks."
+                )
         except Exception as e:
             st.error(f"❌ Error assigning tasks: {e}")
             import traceback
             st.error(traceback.format_exc())
 
-
 if __name__ == "__main__":
     main()
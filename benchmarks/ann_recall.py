@@ -0,0 +1,66 @@
+"""Recall vs. latency of the IVF roster index against the exact matmul path.
+
+Uses synthetic clustered unit vectors shaped like MiniLM embeddings, so it runs
+without downloading any model:
+
+    python benchmarks/ann_recall.py --employees 200000 --tasks 500
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from app import IVFIndex, similarity_matrix, top_k  # noqa: E402
+
+
+def synthetic_embeddings(n, dim, n_clusters, rng):
+    centers = rng.normal(size=(n_clusters, dim)).astype(np.float32)
+    labels = rng.integers(0, n_clusters, size=n)
+    vectors = centers[labels] + 0.6 * rng.normal(size=(n, dim)).astype(np.float32)
+    return vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--employees", type=int, default=200_000)
+    parser.add_argument("--tasks", type=int, default=500)
+    parser.add_argument("--dim", type=int, default=384)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64])
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(args.seed)
+    data = synthetic_embeddings(args.employees + args.tasks, args.dim, 2_000, rng)
+    employees, tasks = data[: args.employees], data[args.employees :]
+    ids = np.arange(args.employees, dtype=np.int64)
+
+    start = time.perf_counter()
+    exact_idx, _ = top_k(similarity_matrix(tasks, employees), args.k)
+    exact_s = time.perf_counter() - start
+    print(f"exact      : {exact_s * 1000:9.1f} ms  ({args.tasks} tasks x {args.employees} employees)")
+
+    start = time.perf_counter()
+    index = IVFIndex.build(employees, ids)
+    print(f"build      : {time.perf_counter() - start:9.2f} s   ({len(index.centroids)} cells)")
+
+    print(f"{'nprobe':>6}  {'recall@1':>8}  {'recall@' + str(args.k):>9}  {'latency':>10}  {'speedup':>7}")
+    for nprobe in args.nprobe:
+        index.nprobe = nprobe
+        start = time.perf_counter()
+        _, found = index.search(tasks, k=args.k)
+        elapsed = time.perf_counter() - start
+        recall_1 = np.mean(found[:, 0] == exact_idx[:, 0])
+        recall_k = np.mean([len(np.intersect1d(f, e)) / args.k for f, e in zip(found, exact_idx)])
+        print(
+            f"{nprobe:>6}  {recall_1:>8.3f}  {recall_k:>9.3f}  {elapsed * 1000:>7.1f} ms  "
+            f"{exact_s / elapsed:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
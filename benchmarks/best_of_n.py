@@ -0,0 +1,79 @@
+"""Best-of-n PRD sections in one batched call vs. n sequential sampled retries.
+
+Both variants draw n samples per PRD section. The score column compares the
+overview section of a single draw with the one best-of-n picks, using the
+ranking score itself; the latency column compares one batched ``generate``
+call with n separate ones:
+
+    python benchmarks/best_of_n.py --n 4 --repeats 3
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import numpy as np
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def sample_scores(texts, reference):
+    """The ranking score ``pick_best_samples`` uses, for every text."""
+    embeddings = app.encode_texts([reference] + list(texts))
+    similarity = embeddings[1:] @ embeddings[0]
+    repetition = np.array([app.repeated_trigram_fraction(text) for text in texts])
+    return similarity - app.BEST_OF_REPETITION_PENALTY * repetition
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--n", type=int, default=app.GENERATION_BEST_OF)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--project", default="Tasker.ai")
+    parser.add_argument(
+        "--description",
+        default="A web app that turns a product brief into tasks and assigns them to employees by skill.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    app.GENERATION_BEST_OF = args.n
+    app.st.session_state["text_generator"] = app.load_text_generator()
+    prompts = app.prd_section_prompts(args.project)
+    prefix = app.prd_context(args.project, args.description)
+
+    # Warm-up so neither variant pays for lazy initialisation
+    app.st.session_state["generation_mode"] = "sample"
+    app.generate_batch_from_model(prompts, prefix=prefix, max_items=app.PRD_SECTION_ITEMS)
+
+    rows = {"retries": ([], []), "best_of_n": ([], [])}
+    for _ in range(args.repeats):
+        app.st.session_state["generation_mode"] = "sample"
+        start = time.perf_counter()
+        drafts = [
+            app.generate_batch_from_model(prompts, prefix=prefix, max_items=app.PRD_SECTION_ITEMS)
+            for _ in range(args.n)
+        ]
+        rows["retries"][0].append(time.perf_counter() - start)
+        # Each retry's overview is what the user gets without ranking
+        rows["retries"][1].extend(sample_scores([texts[0] for texts in drafts], prefix))
+
+        app.st.session_state["generation_mode"] = "best_of_n"
+        start = time.perf_counter()
+        best = app.generate_batch_from_model(prompts, prefix=prefix, max_items=app.PRD_SECTION_ITEMS)
+        rows["best_of_n"][0].append(time.perf_counter() - start)
+        rows["best_of_n"][1].append(sample_scores(best[:1], prefix)[0])
+
+    print(f"{len(prompts)} sections, n={args.n}, {args.repeats} repeats; score = similarity - repetition penalty")
+    print(f"{'mode':>10} {'median s':>9} {'mean score':>11}")
+    for name, (latencies, scores) in rows.items():
+        print(f"{name:>10} {statistics.median(latencies):9.3f} {statistics.mean(scores):11.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,60 @@
+"""Latency of sequential vs. batched PRD section generation.
+
+Generates the three PRD sections once per call to ``generate_from_model`` and
+once through the single batched ``generate_batch_from_model`` pass:
+
+    python benchmarks/generation_batching.py --repeats 5
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import time
+
+import torch
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+
+def timed(fn, repeats):
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=5)
+    parser.add_argument("--project", default="Tasker.ai")
+    parser.add_argument(
+        "--description",
+        default="A web app that turns a product brief into tasks and assigns them to employees by skill.",
+    )
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    torch.manual_seed(args.seed)
+    app.st.session_state["text_generator"] = app.load_text_generator()
+    prompts = app.prd_section_prompts(args.project)
+    prefix = app.prd_context(args.project, args.description)
+
+    # Warm-up so neither variant pays for lazy initialisation
+    app.generate_batch_from_model(prompts, prefix=prefix)
+
+    sequential = timed(lambda: [app.generate_from_model(p, prefix=prefix) for p in prompts], args.repeats)
+    batched = timed(lambda: app.generate_batch_from_model(prompts, prefix=prefix), args.repeats)
+
+    print(f"{len(prompts)} sections, {app.MAX_NEW_TOKENS} new tokens each, {args.repeats} repeats")
+    print(f"{'mode':>10} {'median s':>9} {'min s':>7}")
+    for name, samples in (("sequential", sequential), ("batched", batched)):
+        print(f"{name:>10} {statistics.median(samples):9.3f} {min(samples):7.3f}")
+    print(f"speedup: {statistics.median(sequential) / statistics.median(batched):.2f}x")
+
+
+if __name__ == "__main__":
+    main()
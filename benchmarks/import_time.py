@@ -0,0 +1,80 @@
+"""Cold-start render time of the landing page and workspace, and whether torch was imported.
+
+Each measurement runs in a fresh interpreter through Streamlit's AppTest, with
+the background model warm-up disabled so only the render path is measured:
+
+    python benchmarks/import_time.py --repeats 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+HEAVY_MODULES = ("torch", "transformers", "sentence_transformers")
+
+
+def render_pages():
+    from streamlit.testing.v1 import AppTest
+
+    timings = {}
+    app = AppTest.from_file(APP_PATH, default_timeout=120)
+    start = time.perf_counter()
+    app.run()
+    timings["landing_s"] = time.perf_counter() - start
+    timings["landing_loaded"] = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    app.session_state["show_landing"] = False
+    start = time.perf_counter()
+    app.run()
+    timings["workspace_s"] = time.perf_counter() - start
+    timings["workspace_loaded"] = [name for name in HEAVY_MODULES if name in sys.modules]
+    if app.exception:
+        raise SystemExit(f"app raised: {app.exception[0].message}")
+    return timings
+
+
+def import_heavy_modules():
+    start = time.perf_counter()
+    for name in HEAVY_MODULES:
+        __import__(name)
+    return {"import_s": time.perf_counter() - start}
+
+
+def run_child(mode):
+    env = dict(os.environ, TASKER_MODEL_WARMUP="0")
+    command = [sys.executable, os.path.abspath(__file__), "--child", mode]
+    output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--child", choices=("render", "import"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        result = render_pages() if args.child == "render" else import_heavy_modules()
+        print(json.dumps(result))
+        return
+
+    renders = [run_child("render") for _ in range(args.repeats)]
+    imports = [run_child("import") for _ in range(args.repeats)]
+    print(f"{'landing page':<16}{statistics.median(r['landing_s'] for r in renders):6.2f} s")
+    print(f"{'workspace':<16}{statistics.median(r['workspace_s'] for r in renders):6.2f} s")
+    print(f"{'ML stack import':<16}{statistics.median(r['import_s'] for r in imports):6.2f} s (avoided on both pages)")
+
+    loaded = sorted({name for r in renders for name in r["landing_loaded"] + r["workspace_loaded"]})
+    if loaded:
+        print(f"FAIL: {', '.join(loaded)} imported while rendering")
+        sys.exit(1)
+    print(f"OK: {', '.join(HEAVY_MODULES)} not imported while rendering")
+
+
+if __name__ == "__main__":
+    main()
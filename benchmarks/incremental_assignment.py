@@ -0,0 +1,69 @@
+"""Latency and correctness of incremental ``AssignmentState`` updates.
+
+Replays what the Assign tab does after the first assignment: re-clicking
+Assign with nothing changed, adding a task, and moving a matching-weight
+slider. Each update is timed and its scores are compared with a fresh exact
+scoring; the script exits with status 1 if an update fails or disagrees:
+
+    python benchmarks/incremental_assignment.py --csv candidate_dataset_40.csv
+"""
+
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import app  # noqa: E402
+
+TASKS = [
+    "Build the REST API for user accounts",
+    "Design the dashboard UI in React",
+    "Set up the SQL database schema",
+    "Train a churn prediction model",
+]
+
+
+def main():
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--csv", default=os.path.join(root, "candidate_dataset_40.csv"))
+    parser.add_argument("--atol", type=float, default=1e-4)
+    args = parser.parse_args()
+
+    employees_df = pd.read_csv(args.csv)
+    weights = dict(app.CANDIDATE_FIELD_WEIGHTS)
+    shifted = {**weights, "skills": weights["skills"] / 2}
+    steps = [
+        ("first assignment", TASKS, weights),
+        ("unchanged re-run", TASKS, weights),
+        ("task added", TASKS + ["Write integration tests for the API"], weights),
+        ("weights changed", TASKS + ["Write integration tests for the API"], shifted),
+    ]
+
+    state = app.AssignmentState()
+    failed = False
+    print(f"{len(employees_df)} employees, fields: {', '.join(f for f in weights if f in employees_df)}")
+    print(f"{'step':>18} {'seconds':>8} {'encoded tasks':>14} {'max |diff|':>11}")
+    for name, tasks, step_weights in steps:
+        start = time.perf_counter()
+        try:
+            scores = state.update(tasks, employees_df, step_weights)["scores"]
+        except Exception as e:
+            print(f"{name:>18} FAILED: {e!r}")
+            failed = True
+            continue
+        elapsed = time.perf_counter() - start
+        expected = app.score_tasks(tasks, employees_df, exact=True, weights=step_weights)["scores"]
+        diff = float(np.abs(scores - expected).max()) if scores.size else 0.0
+        failed |= diff > args.atol
+        print(f"{name:>18} {elapsed:8.3f} {state.last_update['encoded_tasks']:>14} {diff:11.2e}")
+    if failed:
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
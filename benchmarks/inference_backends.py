@@ -0,0 +1,89 @@
+"""Load time, decode throughput and peak RSS of each text-generation backend.
+
+Every backend is measured in a fresh subprocess so load time and memory are
+not shared between them:
+
+    python benchmarks/inference_backends.py --new-tokens 128 --threads 4
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PROMPT = "Product Requirements Document for Tasker.ai. Overview: a web app that assigns tasks to employees by skill."
+
+
+def measure(backend, new_tokens, repeats):
+    import torch
+
+    import app
+
+    start = time.perf_counter()
+    generator = app.load_text_generator(backend)
+    load_s = time.perf_counter() - start
+    if generator is None:
+        raise SystemExit(f"could not load backend {backend!r}")
+    tokenizer, model = generator.tokenizer, generator.model
+    input_ids = torch.tensor([tokenizer.encode(PROMPT)])
+    kwargs = dict(
+        attention_mask=torch.ones_like(input_ids),
+        max_new_tokens=new_tokens,
+        min_new_tokens=new_tokens,
+        do_sample=False,
+        pad_token_id=tokenizer.eos_token_id,
+    )
+
+    with torch.inference_mode():
+        model.generate(input_ids, **kwargs)  # warm-up
+        start = time.perf_counter()
+        for _ in range(repeats):
+            model.generate(input_ids, **kwargs)
+        decode_s = time.perf_counter() - start
+
+    return {
+        "backend": backend,
+        "load_s": load_s,
+        "tokens_per_s": new_tokens * repeats / decode_s,
+        # ru_maxrss is reported in KiB on Linux
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    }
+
+
+def main():
+    import app
+
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--backends", nargs="+", default=list(app.INFERENCE_BACKENDS))
+    parser.add_argument("--new-tokens", type=int, default=128)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--threads", type=int, default=0, help="TASKER_TORCH_THREADS for every backend")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(measure(args.child, args.new_tokens, args.repeats)))
+        return
+
+    env = dict(os.environ, TASKER_TORCH_THREADS=str(args.threads))
+    print(f"{'backend':>9} {'load s':>7} {'tokens/s':>9} {'peak RSS MB':>12}")
+    for backend in args.backends:
+        command = [
+            sys.executable, os.path.abspath(__file__), "--child", backend,
+            "--new-tokens", str(args.new_tokens), "--repeats", str(args.repeats),
+        ]
+        output = subprocess.run(command, env=env, capture_output=True, text=True, check=True).stdout
+        result = json.loads(output.strip().splitlines()[-1])
+        print(
+            f"{result['backend']:>9} {result['load_s']:7.2f} "
+            f"{result['tokens_per_s']:9.1f} {result['peak_rss_mb']:12.0f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""Local inference worker that micro-batches text generation across app sessions.
+
+Every Streamlit session otherwise runs ``generate`` on its own script thread
+against the shared model. The worker owns the model instead: sessions send
+requests over a local socket, requests that arrive within ``--max-wait-ms``
+of each other and share a prefix, decoding params and stop unit are decoded
+in one batched ``generate`` call, and a bounded queue turns overload into an
+immediate "busy" reply rather than an ever-growing backlog.
+
+    python inference_worker.py --port 6070
+    TASKER_INFERENCE_WORKER=localhost:6070 streamlit run app.py
+"""
+
+import argparse
+import json
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from multiprocessing.connection import AuthenticationError, Listener
+
+import numpy as np
+
+import app
+
+
+class InferenceWorker:
+    """Request queue plus a batching loop around ``app.complete_batch``."""
+
+    def __init__(self, generator, max_batch=8, max_wait_s=0.02, max_queue=64):
+        self.generator = generator
+        self.max_batch = max_batch
+        self.max_wait_s = max_wait_s
+        self.max_queue = max_queue
+        self.batches = 0
+        self.requests = 0
+        self.rejected = 0
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._held = None
+        self._latencies = deque(maxlen=1000)
+
+    def submit(self, request):
+        """Queue a generate request. Returns a Future for its texts, or None when the queue is full."""
+        future = Future()
+        try:
+            self._queue.put_nowait((time.perf_counter(), request, future))
+        except queue.Full:
+            self.rejected += 1
+            return None
+        return future
+
+    @staticmethod
+    def _rows(request):
+        """Generate rows a request occupies: best-of-n decodes every prompt n times."""
+        return len(request["prompts"]) * request["params"].get("best_of", 1)
+
+    def _gather(self):
+        """Block for one request, then collect more until the batch is full or the wait window closes."""
+        batch = [self._held or self._queue.get()]
+        self._held = None
+        rows = self._rows(batch[0][1])
+        deadline = time.perf_counter() + self.max_wait_s
+        while rows < self.max_batch:
+            remaining = deadline - time.perf_counter()
+            if remaining <= 0:
+                break
+            try:
+                item = self._queue.get(timeout=remaining)
+            except queue.Empty:
+                break
+            if rows + self._rows(item[1]) > self.max_batch:
+                # Would overflow the batch: it opens the next one instead
+                self._held = item
+                break
+            batch.append(item)
+            rows += self._rows(item[1])
+        return batch
+
+    def run(self):
+        while True:
+            groups = {}
+            for item in self._gather():
+                request = item[1]
+                # Only requests with the same prefix, params and stop unit can share a generate call
+                key = (request["prefix"], json.dumps(request["params"], sort_keys=True), request["unit"])
+                groups.setdefault(key, []).append(item)
+            for items in groups.values():
+                self._run_group(items)
+
+    def _run_group(self, items):
+        prompts, limits = [], []
+        for _, request, _ in items:
+            prompts.extend(request["prompts"])
+            limits.extend(request["max_items"] or [None] * len(request["prompts"]))
+        first = items[0][1]
+        try:
+            texts = app.complete_batch(
+                self.generator, prompts, first["prefix"], first["params"], limits, first["unit"]
+            )
+        except Exception as e:
+            for _, _, future in items:
+                future.set_exception(e)
+            return
+        self.batches += 1
+        finished = time.perf_counter()
+        offset = 0
+        for enqueued, request, future in items:
+            count = len(request["prompts"])
+            future.set_result(texts[offset:offset + count])
+            offset += count
+            self._latencies.append(finished - enqueued)
+            self.requests += 1
+
+    def stats(self):
+        latencies_ms = np.asarray(self._latencies, dtype=np.float64) * 1000
+        return {
+            "queue_depth": self._queue.qsize() + (self._held is not None),
+            "max_queue": self.max_queue,
+            "p50_ms": float(np.percentile(latencies_ms, 50)) if len(latencies_ms) else 0.0,
+            "p99_ms": float(np.percentile(latencies_ms, 99)) if len(latencies_ms) else 0.0,
+            "batches": self.batches,
+            "requests": self.requests,
+            "rejected": self.rejected,
+        }
+
+
+def serve_connection(conn, worker):
+    """Answer the single request sent on ``conn``."""
+    with conn:
+        try:
+            message = conn.recv()
+        except EOFError:
+            return
+        op = message.get("op")
+        if op == "stats":
+            conn.send(worker.stats())
+            return
+        if op != "generate":
+            conn.send({"error": f"unknown op {op!r}"})
+            return
+        future = worker.submit(message)
+        if future is None:
+            conn.send({"error": "busy: request queue is full, retry shortly"})
+            return
+        try:
+            conn.send({"texts": future.result()})
+        except Exception as e:
+            conn.send({"error": str(e)})
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=6070)
+    parser.add_argument("--max-batch", type=int, default=8, help="Generate rows decoded together at most (prompts x best-of-n samples)")
+    parser.add_argument("--max-wait-ms", type=float, default=20, help="How long the first request waits for company")
+    parser.add_argument("--max-queue", type=int, default=64, help="Queued requests before new ones are refused")
+    parser.add_argument("--backend", default=app.INFERENCE_BACKEND, choices=app.INFERENCE_BACKENDS)
+    args = parser.parse_args()
+
+    # Resolve the key before loading the model so a bad key setup fails fast
+    authkey = app.inference_worker_authkey(create=True)
+    generator = app.load_text_generator(args.backend)
+    if generator is None:
+        raise SystemExit("could not load the text generation model")
+    worker = InferenceWorker(generator, args.max_batch, args.max_wait_ms / 1000, args.max_queue)
+    threading.Thread(target=worker.run, name="inference-batcher", daemon=True).start()
+
+    with Listener((args.host, args.port), authkey=authkey) as listener:
+        print(f"inference worker listening on {args.host}:{args.port}", flush=True)
+        while True:
+            try:
+                conn = listener.accept()
+            except (OSError, AuthenticationError):
+                continue
+            threading.Thread(target=serve_connection, args=(conn, worker), daemon=True).start()
+
+
+if __name__ == "__main__":
+    main()